@@ -0,0 +1,213 @@
+"""Memory and decode benchmark for the model package.
+
+Builds a synthetic PlayerView, prints the size of one instance of every
+slotted model class and the time to decode one PlayerView with each codec
+and decoder mode:
+
+    python bench.py [--width 40] [--height 30] [--repeat 200] [--check]
+
+With --check the script fails if a slotted class got its __dict__ back or
+grew over MAX_INSTANCE_BYTES, so the memory gain can't silently regress,
+or if a message read by either codec or any GameDecoder mode and written
+back by either codec differs from the original bytes, so the generated
+codecs can't drift from the schema of the model classes.
+"""
+import argparse
+import io
+import random
+import sys
+import time
+
+import model
+import model_codecs
+from game_decoder import GameDecoder
+from stream_wrapper import StreamWrapper, BufferedStreamWrapper
+
+
+# getsizeof of a slotted instance is 16 bytes of header plus 8 per slot
+MAX_INSTANCE_BYTES = 128
+
+
+def make_properties():
+    weapon_params = {
+        model.WeaponType.PISTOL: model.WeaponParams(
+            8, 0.4, 1.0, 0.05, 0.5, 0.5, 1.0, model.BulletParams(50.0, 0.2, 20), None),
+        model.WeaponType.ASSAULT_RIFLE: model.WeaponParams(
+            20, 0.1, 1.0, 0.1, 0.5, 0.2, 1.9, model.BulletParams(50.0, 0.2, 5), None),
+        model.WeaponType.ROCKET_LAUNCHER: model.WeaponParams(
+            1, 1.0, 1.0, 0.1, 0.5, 1.0, 1.0, model.BulletParams(20.0, 0.4, 30), model.ExplosionParams(3.0, 50)),
+    }
+    return model.Properties(
+        3600, 2, 60.0, 100, model.Vec2Double(0.5, 0.5), model.Vec2Double(0.9, 1.8),
+        10.0, 10.0, 0.55, 10.0, 0.525, 20.0, 100, 50, weapon_params,
+        model.Vec2Double(0.5, 0.5), model.ExplosionParams(3.0, 50), 1.0, 0.5, 1.0, 1000)
+
+
+def make_level(width, height, rnd):
+    tiles = [[model.Tile.EMPTY] * height for _ in range(width)]
+    for x in range(width):
+        tiles[x][0] = tiles[x][height - 1] = model.Tile.WALL
+    for y in range(height):
+        tiles[0][y] = tiles[width - 1][y] = model.Tile.WALL
+    kinds = [model.Tile.WALL, model.Tile.PLATFORM, model.Tile.LADDER, model.Tile.JUMP_PAD]
+    for _ in range(width * height // 12):
+        tiles[rnd.randrange(1, width - 1)][rnd.randrange(1, height - 1)] = rnd.choice(kinds)
+    return model.Level(tiles)
+
+
+def make_player_view(width=40, height=30, units=4, bullets=20, mines=4, loot_boxes=20, seed=1):
+    rnd = random.Random(seed)
+    properties = make_properties()
+
+    def position():
+        return model.Vec2Double(rnd.uniform(1, width - 1), rnd.uniform(1, height - 1))
+
+    unit_list = []
+    for i in range(units):
+        weapon_type = model.WeaponType(i % 3)
+        weapon = model.Weapon(weapon_type, properties.weapon_params[weapon_type], 5, False, 0.1, 0.3, 1.5, 42)
+        unit_list.append(model.Unit(
+            1 + i % 2, i, 100, position(), properties.unit_size, model.JumpState(True, 10.0, 0.55, True),
+            True, False, True, False, 1, weapon if i % 2 else None))
+    bullet_list = [
+        model.Bullet(model.WeaponType(i % 3), i % units, 1 + i % 2, position(), model.Vec2Double(50.0, 0.0),
+                     20, 0.2, model.ExplosionParams(3.0, 50) if i % 3 == 2 else None)
+        for i in range(bullets)]
+    mine_list = [
+        model.Mine(1, position(), properties.mine_size, model.MineState.IDLE, None, 1.0, model.ExplosionParams(3.0, 50))
+        for _ in range(mines)]
+    items = [model.Item.HealthPack(50), model.Item.Weapon(model.WeaponType.PISTOL), model.Item.Mine()]
+    loot_box_list = [model.LootBox(position(), properties.loot_box_size, items[i % 3]) for i in range(loot_boxes)]
+    game = model.Game(0, properties, make_level(width, height, rnd), [model.Player(1, 0), model.Player(2, 0)],
+                      unit_list, bullet_list, mine_list, loot_box_list)
+    return model.PlayerView(1, game)
+
+
+def instance_bytes(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def sample_instances(player_view):
+    game = player_view.game
+    unit = next(u for u in game.units if u.weapon is not None)
+    return {
+        model.Vec2Double: unit.position,
+        model.Unit: unit,
+        model.Bullet: game.bullets[0],
+        model.Mine: game.mines[0],
+        model.LootBox: game.loot_boxes[0],
+        model.JumpState: unit.jump_state,
+        model.Weapon: unit.weapon,
+        model.UnitAction: model.UnitAction(0.0, False, False, model.Vec2Double(0.0, 0.0), True, False, False, False),
+    }
+
+
+def serialize(message, generated):
+    model_codecs.use_generated_codecs(generated)
+    data = io.BytesIO()
+    message.write_to(StreamWrapper(data))
+    return data.getvalue()
+
+
+DECODER_MODES = [
+    ('read_from', lambda: model.ServerMessageGame.read_from),
+    ('decoder', lambda: GameDecoder().read_message),
+    ('decoder lazy', lambda: GameDecoder(lazy_entities=True).read_message),
+    ('decoder reuse', lambda: GameDecoder(reuse_units=True).read_message),
+]
+
+
+def codec_mismatches(messages):
+    """'read codec/mode/write codec' of the round trips of :messages that don't give back their bytes.
+
+    One decoder reads all :messages in turn, so the cached and reused paths
+    are taken from the second message on
+    """
+    expected = [serialize(message, False) for message in messages]
+    failed = []
+    for read_generated in (False, True):
+        for mode, make_read in DECODER_MODES:
+            model_codecs.use_generated_codecs(read_generated)
+            read = make_read()
+            for data in expected:
+                model_codecs.use_generated_codecs(read_generated)
+                message = read(BufferedStreamWrapper(io.BytesIO(data)))
+                # Written back before the next read, which may update the reused units in place.
+                # Lazy entities are decoded on first access, by the read codec as it writes first
+                for write_generated in (read_generated, not read_generated):
+                    name = '/'.join(['generated' if read_generated else 'original', mode,
+                                     'generated' if write_generated else 'original'])
+                    if serialize(message, write_generated) != data and name not in failed:
+                        failed.append(name)
+
+    action = model.UnitAction(1.5, True, False, model.Vec2Double(-2.0, 0.5), True, False, True, False)
+    data = serialize(action, False)
+    for generated in (False, True):
+        model_codecs.use_generated_codecs(generated)
+        read_back = model.UnitAction.read_from(BufferedStreamWrapper(io.BytesIO(data)))
+        if serialize(action, generated) != data or serialize(read_back, generated) != data:
+            failed.append('UnitAction/' + ('generated' if generated else 'original'))
+    model_codecs.use_generated_codecs(False)
+    return failed
+
+
+def decode_ms(data, repeat, read):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        read(BufferedStreamWrapper(io.BytesIO(data)))
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--width', type=int, default=40)
+    parser.add_argument('--height', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--check', action='store_true')
+    args = parser.parse_args()
+
+    player_view = make_player_view(args.width, args.height)
+    data = io.BytesIO()
+    model.ServerMessageGame(player_view).write_to(StreamWrapper(data))
+    data = data.getvalue()
+
+    failed = []
+    print('bytes per instance')
+    for cls, obj in sample_instances(player_view).items():
+        size = instance_bytes(obj)
+        print('  {:<12}{:>6}'.format(cls.__name__, size))
+        if hasattr(obj, '__dict__') or size > MAX_INSTANCE_BYTES:
+            failed.append(cls.__name__)
+
+    print('ms per PlayerView ({} bytes)'.format(len(data)))
+    for generated in (False, True):
+        model_codecs.use_generated_codecs(generated)
+        codec = 'generated' if generated else 'original'
+        modes = [
+            ('read_from', model.ServerMessageGame.read_from),
+            ('decoder', GameDecoder().read_message),
+            ('decoder lazy', GameDecoder(lazy_entities=True).read_message),
+            ('decoder reuse', GameDecoder(reuse_units=True).read_message),
+        ]
+        for mode, read in modes:
+            print('  {:<10}{:<14}{:>8.3f}'.format(codec, mode, decode_ms(data, args.repeat, read)))
+    model_codecs.use_generated_codecs(False)
+
+    if args.check:
+        # Same unit ids in every view, their fields change from one to the next
+        views = [player_view, make_player_view(args.width, args.height, seed=2), player_view]
+        mismatches = codec_mismatches([model.ServerMessageGame(view) for view in views] +
+                                      [model.ServerMessageGame(None)])
+        for mismatch in mismatches:
+            print('codec mismatch: {}'.format(mismatch))
+        if failed:
+            print('slots regression: {}'.format(', '.join(failed)))
+        if failed or mismatches:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Hierarchical path search over the navigation graph.
+
+The level is cut into square clusters of vertices. Entrances are the
+vertices with an edge to or from another cluster; for every cluster the
+move times between its entrances, through the cluster only, are computed
+once. A query searches this small abstract graph of entrances from the
+start vertex to the goal and then refines only the clusters the route goes
+through, so its cost follows the route length instead of the map area.
+
+Every path between two vertices splits into runs inside one cluster joined
+by edges between clusters, so the route found is as fast as a flat search.
+"""
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+INTRA = 0  # abstract edge through one cluster, refined by a cluster search
+INTER = 1  # edge of the graph between two clusters
+
+
+class ClusterGraph(object):
+    def __init__(self, graph, cluster_size=8, intra=None):
+        """:graph - my_strategy.Graph, :cluster_size - cluster side in cells,
+        :intra - the costs between entrances if they are already known, e.g. from BackgroundEdges"""
+        self.graph = graph
+        self.cluster_size = cluster_size
+        count = len(graph.vertexes)
+        self.cluster = [(x // cluster_size, y // cluster_size) for x, y in graph.positions]
+
+        self.forward = [[] for _ in range(count)]  # (target, cost) of the edges from i
+        self.reverse = [[] for _ in range(count)]  # (source, cost) of the edges to i
+        self.inter = [[] for _ in range(count)]  # (target, cost) of the edges from i to other clusters
+        for i in range(count):
+            targets, _, costs = graph.edges(i)
+            for j, cost in zip(targets.tolist(), costs.tolist()):
+                self.forward[i].append((j, cost))
+                self.reverse[j].append((i, cost))
+                if self.cluster[i] != self.cluster[j]:
+                    self.inter[i].append((j, cost))
+
+        self.entrances = {}  # type: Dict[Tuple[int, int], List[int]]
+        for i in range(count):
+            if self.inter[i] or any(self.cluster[j] != self.cluster[i] for j, _ in self.reverse[i]):
+                self.entrances.setdefault(self.cluster[i], []).append(i)
+
+        if intra is None:
+            intra = [[] for _ in range(count)]
+            for entrances in self.entrances.values():
+                for entrance in entrances:
+                    distance, _ = self.cluster_search(entrance)
+                    intra[entrance] = [(other, distance[other]) for other in entrances
+                                       if other != entrance and other in distance]
+        self.intra = intra  # (entrance, cost) through the cluster of entrance i
+
+    def cluster_search(self, source, target=None, reverse=False):
+        """Dijkstra from :source over the vertices of its cluster only, up to :target if given.
+
+        With :reverse the edges are followed backwards, i.e. distances are to
+        :source. Returns (distance, parent) dicts
+        """
+        cluster = self.cluster[source]
+        edges = self.reverse if reverse else self.forward
+        distance = {source: 0.}
+        parent = {source: -1}
+        closed = set()
+        heap = [(0., source)]
+        while heap:
+            cur_distance, cur_i = heapq.heappop(heap)
+            if cur_i in closed:
+                continue
+            if cur_i == target:
+                break
+            closed.add(cur_i)
+            for i, cost in edges[cur_i]:
+                new_distance = cur_distance + cost
+                if self.cluster[i] == cluster and new_distance < distance.get(i, float('inf')):
+                    distance[i] = new_distance
+                    parent[i] = cur_i
+                    heapq.heappush(heap, (new_distance, i))
+        return distance, parent
+
+    def path(self, index_from, index_to) -> Optional[List[int]]:
+        """Vertices of the fastest path from :index_from to :index_to, None if there is none"""
+        if index_from == index_to:
+            return [index_from]
+        # The start and the goal join the abstract graph by searches in their clusters
+        from_start, _ = self.cluster_search(index_from)
+        start_edges = [(i, cost) for i, cost in from_start.items()
+                       if i != index_from and (i == index_to or self.inter[i] or self.intra[i])]
+        to_goal, _ = self.cluster_search(index_to, reverse=True)
+
+        distance = {index_from: 0.}
+        parent = {index_from: (-1, INTRA)}
+        closed = set()
+        heap = [(0., index_from)]
+        while heap:
+            _, cur_i = heapq.heappop(heap)
+            if cur_i in closed:
+                continue
+            if cur_i == index_to:
+                break
+            closed.add(cur_i)
+            steps = [(i, cost, INTRA) for i, cost in (start_edges if cur_i == index_from else self.intra[cur_i])]
+            steps.extend((i, cost, INTER) for i, cost in self.inter[cur_i])
+            if cur_i in to_goal:
+                steps.append((index_to, to_goal[cur_i], INTRA))
+            for i, cost, kind in steps:
+                new_distance = distance[cur_i] + cost
+                if new_distance < distance.get(i, float('inf')):
+                    distance[i] = new_distance
+                    parent[i] = (cur_i, kind)
+                    heapq.heappush(heap, (new_distance + self.graph.heuristic(i, index_to), i))
+        if index_to not in parent:
+            return None
+
+        route = [index_to]
+        while route[-1] != index_from:
+            route.append(parent[route[-1]][0])
+        route.reverse()
+
+        path = [index_from]
+        for i, j in zip(route, route[1:]):
+            if parent[j][1] == INTER:
+                path.append(j)
+                continue
+            _, cluster_parent = self.cluster_search(i, j)
+            refined = [j]
+            while refined[-1] != i:
+                refined.append(cluster_parent[refined[-1]])
+            path.extend(reversed(refined[:-1]))
+        return path
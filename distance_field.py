@@ -0,0 +1,66 @@
+"""Move times from one vertex to every other one.
+
+Picking between health packs, weapons and enemies needs the travel time to
+each of them. A DistanceField is one Dijkstra from the unit's vertex; the
+time to any entity and the path to it are then lookups.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import model
+
+
+class DistanceField(object):
+    def __init__(self, graph, source, distance: np.ndarray, parent: np.ndarray):
+        """:distance[i] - move time from :source to vertex i, inf if unreachable,
+        :parent[i] - vertex before i on that path, -1 for the source and unreachable ones"""
+        self.graph = graph
+        self.source = source
+        self.distance = distance
+        self.parent = parent
+
+    @staticmethod
+    def from_search(graph, source) -> 'DistanceField':
+        graph.search(source)
+        count = len(graph.vertexes)
+        reached = [i for i in range(count) if graph.visited[i] == graph.search_id]
+        distance = np.full(count, np.inf)
+        parent = np.full(count, -1, dtype=np.int32)
+        distance[reached] = [graph.distance[i] for i in reached]
+        parent[reached] = [graph.parent[i] for i in reached]
+        return DistanceField(graph, source, distance, parent)
+
+    def time_to(self, position: model.Vec2Double) -> float:
+        """Move time to the vertex at :position, inf if there is none or it's unreachable"""
+        index = self.graph.vertex_index(position)
+        return float(self.distance[index]) if index is not None else float('inf')
+
+    def path_to(self, index) -> Optional[List[int]]:
+        """Vertices from the source to vertex :index, None if it's unreachable"""
+        if not np.isfinite(self.distance[index]):
+            return None
+        path = [index]
+        while path[-1] != self.source:
+            path.append(int(self.parent[path[-1]]))
+        path.reverse()
+        return path
+
+    def rank(self, entities) -> List[Tuple[float, object]]:
+        """(move time, entity) of the reachable :entities, nearest first"""
+        ranked = [(self.time_to(entity.position), i, entity) for i, entity in enumerate(entities)]
+        ranked.sort(key=lambda item: item[:2])
+        return [(time, entity) for time, _, entity in ranked if time != float('inf')]
+
+
+def rank_loot_boxes(field: DistanceField, game: model.Game, item_class=None) -> List[Tuple[float, model.LootBox]]:
+    """Loot boxes by move time, only those holding :item_class (e.g. model.Item.HealthPack) if given"""
+    loot_boxes = game.loot_boxes
+    if item_class is not None:
+        loot_boxes = [loot_box for loot_box in loot_boxes if isinstance(loot_box.item, item_class)]
+    return field.rank(loot_boxes)
+
+
+def rank_enemies(field: DistanceField, game: model.Game, unit: model.Unit) -> List[Tuple[float, model.Unit]]:
+    """Units of the other players by move time from :unit"""
+    return field.rank([enemy for enemy in game.units if enemy.player_id != unit.player_id])
@@ -0,0 +1,173 @@
+"""Stateful decoding of server messages across ticks.
+
+The level and the game properties never change during a game, so
+GameDecoder keeps the decoded Level and Properties and hands back the very
+same objects while their raw bytes stay the same. Everything else is read
+through the model classes, so it works with both the original and the
+generated codecs.
+
+With lazy_entities units, bullets, mines and loot boxes are not decoded
+at all: the Game gets EntityView sequences over the raw bytes of every
+entity, and an entity is built only when it is indexed.
+
+With reuse_units the decoder keeps the live Unit objects by id and updates
+them in place every tick, together with their position, size, jump state
+and weapon. Only newly spawned units are allocated, dead ones are dropped.
+"""
+import io
+import struct
+from collections.abc import Sequence
+
+import model
+from model_codecs import array_struct, count_objects, field_offset, into_reader, read_raw
+from stream_wrapper import StreamWrapper, BytesStreamWrapper
+
+
+TILES = {tile.value: tile for tile in model.Tile}
+
+POSITION_STRUCT = struct.Struct('<dd')
+ID_STRUCT = struct.Struct('<i')
+
+
+class EntityView(Sequence):
+    """Read-only list of model objects decoded from their raw bytes on first access"""
+
+    def __init__(self, cls, raw_entities):
+        self.cls = cls
+        self.raw_entities = raw_entities
+        self.entities = [None] * len(raw_entities)
+        self.position_offset = field_offset(cls, 'position')
+
+    def __len__(self):
+        return len(self.raw_entities)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        entity = self.entities[index]
+        if entity is None:
+            entity = self.cls.read_from(BytesStreamWrapper(self.raw_entities[index]))
+            self.entities[index] = entity
+        return entity
+
+    def position(self, index):
+        """(x, y) of one entity without decoding it"""
+        return POSITION_STRUCT.unpack_from(self.raw_entities[index], self.position_offset)
+
+    def positions(self):
+        unpack_from = POSITION_STRUCT.unpack_from
+        offset = self.position_offset
+        return [unpack_from(raw, offset) for raw in self.raw_entities]
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class GameDecoder(object):
+    def __init__(self, cache_level=True, cache_properties=True, lazy_entities=False, reuse_units=False):
+        self.cache_level = cache_level
+        self.cache_properties = cache_properties
+        self.lazy_entities = lazy_entities
+        self.reuse_units = reuse_units
+
+        self.level = None
+        self.level_key = None
+        self.level_rows = None
+        self.level_hits = 0
+        self.level_misses = 0
+
+        self.properties = None
+        self.properties_raw = None
+        self.properties_objects = 0
+        self.properties_hits = 0
+        self.properties_bytes_skipped = 0
+        self.properties_objects_skipped = 0
+
+        self.units = {}
+        self.units_reused = 0
+        self.units_allocated = 0
+        self.units_evicted = 0
+
+    def read_message(self, stream) -> model.ServerMessageGame:
+        if not stream.read_bool():
+            return model.ServerMessageGame(None)
+        my_id = stream.read_int()
+        return model.ServerMessageGame(model.PlayerView(my_id, self.read_game(stream)))
+
+    def read_game(self, stream) -> model.Game:
+        current_tick = stream.read_int()
+        properties = self.read_properties(stream) if self.cache_properties else model.Properties.read_from(stream)
+        level = self.read_level(stream) if self.cache_level else model.Level.read_from(stream)
+        players = [model.Player.read_from(stream) for _ in range(stream.read_int())]
+        units = self.read_units(stream) if self.reuse_units else self.read_entities(model.Unit, stream)
+        bullets = self.read_entities(model.Bullet, stream)
+        mines = self.read_entities(model.Mine, stream)
+        loot_boxes = self.read_entities(model.LootBox, stream)
+        return model.Game(current_tick, properties, level, players, units, bullets, mines, loot_boxes)
+
+    def read_entities(self, cls, stream):
+        if self.lazy_entities:
+            # Raw copies still walk every entity, so the stream ends up past the section
+            return EntityView(cls, [read_raw(cls, stream) for _ in range(stream.read_int())])
+        return [cls.read_from(stream) for _ in range(stream.read_int())]
+
+    def read_units(self, stream):
+        """Update the units we already know in place, allocate only the new ones"""
+        read_into = into_reader(model.Unit)
+        id_offset = field_offset(model.Unit, 'id')
+        units = []
+        alive = {}
+        for _ in range(stream.read_int()):
+            raw = read_raw(model.Unit, stream)
+            unit_id = ID_STRUCT.unpack_from(raw, id_offset)[0]
+            unit = self.units.get(unit_id)
+            if unit is None:
+                unit = model.Unit.read_from(BytesStreamWrapper(raw))
+                self.units_allocated += 1
+            else:
+                read_into(unit, BytesStreamWrapper(raw))
+                self.units_reused += 1
+            alive[unit_id] = unit
+            units.append(unit)
+        self.units_evicted += len(self.units.keys() - alive.keys())
+        self.units = alive
+        return units
+
+    def read_properties(self, stream) -> model.Properties:
+        """Copy the raw Properties bytes, decode them only if they differ from the cached copy"""
+        raw = read_raw(model.Properties, stream)
+        if raw == self.properties_raw:
+            self.properties_hits += 1
+            self.properties_bytes_skipped += len(raw)
+            self.properties_objects_skipped += self.properties_objects
+            return self.properties
+        self.properties = model.Properties.read_from(StreamWrapper(io.BytesIO(raw)))
+        self.properties_raw = raw
+        self.properties_objects = count_objects(self.properties)
+        return self.properties
+
+    def read_level(self, stream) -> model.Level:
+        """Read the raw tile block, build Tile lists only if it differs from the cached one"""
+        rows = tuple(stream.read_bytes(4 * stream.read_int()) for _ in range(stream.read_int()))
+        key = hash(rows)
+        if key == self.level_key and rows == self.level_rows:
+            self.level_hits += 1
+            return self.level
+        self.level_misses += 1
+        tiles = [list(map(TILES.__getitem__, array_struct('i', len(row) // 4).unpack(row))) for row in rows]
+        self.level = model.Level(tiles)
+        self.level_key = key
+        self.level_rows = rows
+        return self.level
+
+    def stats(self):
+        return {
+            'level_hits': self.level_hits,
+            'level_misses': self.level_misses,
+            'properties_hits': self.properties_hits,
+            'properties_bytes_skipped': self.properties_bytes_skipped,
+            'properties_objects_skipped': self.properties_objects_skipped,
+            'units_reused': self.units_reused,
+            'units_allocated': self.units_allocated,
+            'units_evicted': self.units_evicted,
+        }
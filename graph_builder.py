@@ -0,0 +1,251 @@
+"""Edge computation for the navigation graph.
+
+Checking every vertex pair in Python is what makes the graph build slow,
+and most pairs are rejected by cheap tests anyway. EdgeBuilder runs those
+tests for one source vertex against all the others at once with NumPy
+over the vertex coordinates, when the row of that vertex is asked for:
+    * walk edges: same row, no wall or jump pad between, no hole under;
+    * jump reach: vertical limit max_dy and radial limit max_r.
+Only pairs that can't be walked but are within reach go to the jump check,
+a lookup of the precomputed arc of their offset in JumpTemplates.
+
+Rows of different source vertices are independent: build_rows can split
+them across worker processes, which get only the tile bytes, the jump
+physics and the vertex cells, and BackgroundEdges runs the same workers
+without waiting for them.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import model
+from cluster_graph import ClusterGraph
+from jump_templates import JumpTemplates
+from movements import JumpParams, MovementType
+from primitives import LevelPoint
+from routing_table import RoutingTable
+from tile_grid import TileGrid
+
+
+class JumpPhysics(object):
+    """The fields of model.Properties the jump geometry depends on"""
+    __slots__ = ('unit_max_horizontal_speed', 'unit_jump_speed', 'unit_fall_speed', 'unit_jump_time')
+
+    def __init__(self, unit_max_horizontal_speed, unit_jump_speed, unit_fall_speed, unit_jump_time):
+        self.unit_max_horizontal_speed = unit_max_horizontal_speed
+        self.unit_jump_speed = unit_jump_speed
+        self.unit_fall_speed = unit_fall_speed
+        self.unit_jump_time = unit_jump_time
+
+    def to_tuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    @staticmethod
+    def of(properties: model.Properties) -> 'JumpPhysics':
+        return JumpPhysics(*(getattr(properties, name) for name in JumpPhysics.__slots__))
+
+
+class EdgeBuilder(object):
+    def __init__(self, grid: TileGrid, properties: model.Properties, positions: List[Tuple[int, int]]):
+        """:positions - integer (x, y) cells of the graph vertices"""
+        self.grid = grid
+        self.properties = properties
+        self.positions = positions
+        self.templates = JumpTemplates.of(properties)
+        self.jump_checks = 0  # pairs that went to the exact jump check
+
+        self.xs = np.array([x for x, _ in positions], dtype=np.int64).reshape(-1)
+        self.ys = np.array([y for _, y in positions], dtype=np.int64).reshape(-1)
+        # Vertices are told apart by LevelPoint.stred_position, so are the pairs here
+        self.keys = np.array([str(x) + str(y) for x, y in positions])
+        self.max_dy = JumpParams.get_jump_max_dy(properties)
+        self.max_r = JumpParams.get_jump_max_r(properties)
+
+    def row(self, i) -> List[Tuple[int, MovementType]]:
+        """Outgoing edges of vertex :i as (target index, movement type), by target index"""
+        x, y = self.positions[i]
+        xs, ys = self.xs, self.ys
+        distinct = self.keys != self.keys[i]
+
+        walk = distinct & (ys == y) & (y > 0)
+        on_row = np.flatnonzero(walk)
+        if len(on_row):
+            # Walls and jump pads on the row, holes under it: none may be between the two cells
+            grid = self.grid
+            blocking = grid.row_counts('wall', y, y + 1) + grid.row_counts('jump_pad', y, y + 1) + \
+                grid.row_counts('empty', y - 1, y)
+            walk[on_row] = blocking[np.minimum(x, xs[on_row])] == blocking[np.maximum(x, xs[on_row])]
+
+        dx = (x - xs).astype(np.float64)
+        dy = (y - ys).astype(np.float64)
+        in_reach = (np.fabs(dy) <= self.max_dy) & (np.sqrt(np.fabs(dx ** 2 + dy ** 2)) <= self.max_r)
+        jump_candidates = np.flatnonzero(distinct & ~walk & in_reach)
+        self.jump_checks += len(jump_candidates)
+
+        edges = [(int(j), MovementType.MOVE_TO) for j in np.flatnonzero(walk)]
+        for j in jump_candidates:
+            to_x, to_y = self.positions[j]
+            if self.templates.is_clear(self.grid, x, y, to_x, to_y):
+                edges.append((int(j), MovementType.JUMP_TO))
+        edges.sort(key=lambda edge: edge[0])
+        return edges
+
+
+def snap_index(grid: TileGrid, positions: List[Tuple[int, int]]) -> np.ndarray:
+    """(y, x) array of the vertex every cell of :grid snaps to.
+
+    A vertex cell maps to itself, a cell above one to the first vertex below
+    it in its column, where a falling unit lands, unless a wall or a jump pad
+    is in between. Cells with no such vertex (inside walls, above jump pads)
+    are -1.
+    """
+    index = np.full((grid.height, grid.width), -1, dtype=np.int32)
+    if not positions:
+        return index
+    xs = np.array([x for x, _ in positions], dtype=np.int64)
+    ys = np.array([y for _, y in positions], dtype=np.int64)
+    index[ys, xs] = np.arange(len(positions), dtype=np.int32)
+
+    # Rows of the highest vertex and of the highest wall or jump pad at or below every cell
+    rows = np.broadcast_to(np.arange(grid.height)[:, None], index.shape)
+    landing_row = np.maximum.accumulate(np.where(index >= 0, rows, -1), axis=0)
+    blocking_row = np.maximum.accumulate(np.where(grid.wall | grid.jump_pad, rows, -1), axis=0)
+    columns = np.broadcast_to(np.arange(grid.width)[None, :], index.shape)
+    return np.where(landing_row > blocking_row, index[np.maximum(landing_row, 0), columns], -1)
+
+
+def move_time(properties: model.Properties, from_cell, to_cell, move_type: MovementType):
+    """Estimated seconds to move along the edge between two vertex cells"""
+    dx = to_cell[0] - from_cell[0]
+    if move_type == MovementType.JUMP_TO:
+        return JumpTemplates.of(properties).get(dx, to_cell[1] - from_cell[1]).time
+    return abs(dx) / properties.unit_max_horizontal_speed
+
+
+def edge_arrays(properties: model.Properties, positions: List[Tuple[int, int]], i, edges):
+    """(targets, move_codes, costs) arrays of the :edges from vertex :i, as Graph keeps them"""
+    from_cell = positions[i]
+    targets = np.array([j for j, _ in edges], dtype=np.int32)
+    move_codes = np.array([move_type.value for _, move_type in edges], dtype=np.int8)
+    costs = np.array([move_time(properties, from_cell, positions[j], move_type) for j, move_type in edges],
+                     dtype=np.float64)
+    return targets, move_codes, costs
+
+
+def csr_arrays(rows):
+    """(offsets, targets, move_codes, costs) of the edge_arrays :rows of consecutive vertices"""
+    offsets = np.zeros(len(rows) + 1, dtype=np.int32)
+    np.cumsum([len(targets) for targets, _, _ in rows], out=offsets[1:])
+    return (offsets,
+            np.concatenate([row[0] for row in rows] + [np.zeros(0, dtype=np.int32)]),
+            np.concatenate([row[1] for row in rows] + [np.zeros(0, dtype=np.int8)]),
+            np.concatenate([row[2] for row in rows] + [np.zeros(0, dtype=np.float64)]))
+
+
+# Level and EdgeBuilder of a worker process, made once by _init_worker
+_worker_level = None
+_worker_builder = None
+
+
+def _init_worker(tiles, height, width, physics, positions):
+    global _worker_level, _worker_builder
+    rows = np.frombuffer(tiles, dtype=np.uint8).reshape(height, width)
+    _worker_level = model.Level([[model.Tile(tile) for tile in column] for column in rows.T.tolist()])
+    _worker_builder = EdgeBuilder(TileGrid(_worker_level), JumpPhysics(*physics), positions)
+
+
+def _worker_rows(sources):
+    return [[(j, move_type.value) for j, move_type in _worker_builder.row(i)] for i in sources]
+
+
+def _worker_edge_arrays(sources):
+    builder = _worker_builder
+    return [edge_arrays(builder.properties, builder.positions, i, builder.row(i)) for i in sources]
+
+
+def _worker_paths(csr, routes, cluster_size):
+    """RoutingTable if :routes, else ClusterGraph.intra of :cluster_size, of the graph with the edges :csr"""
+    from my_strategy import Graph  # my_strategy imports this module
+
+    builder = _worker_builder
+    grid = builder.grid
+    vertexes = [LevelPoint(grid.tile(x, y), model.Vec2Double(x, y)) for x, y in builder.positions]
+    # The path searches only need the level and the jump physics of the game
+    game = model.Game(0, builder.properties, _worker_level, [], [], [], [], [])
+    graph = Graph(game, vertexes, csr=csr)
+    if routes:
+        return RoutingTable.build(graph)
+    return ClusterGraph(graph, cluster_size).intra
+
+
+def _worker_args(grid: TileGrid, properties: model.Properties, positions: List[Tuple[int, int]]):
+    return grid.tiles.tobytes(), grid.height, grid.width, JumpPhysics.of(properties).to_tuple(), positions
+
+
+def _chunks(count, chunk_size):
+    return [range(start, min(start + chunk_size, count)) for start in range(0, count, chunk_size)]
+
+
+def build_rows(grid: TileGrid, properties: model.Properties, positions: List[Tuple[int, int]],
+               workers=0, chunk_size=64) -> List[List[Tuple[int, MovementType]]]:
+    """EdgeBuilder.row of every vertex, computed by :workers processes if more than one"""
+    if workers <= 1 or len(positions) <= chunk_size:
+        builder = EdgeBuilder(grid, properties, positions)
+        return [builder.row(i) for i in range(len(positions))]
+
+    rows = []
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=_worker_args(grid, properties, positions)) as pool:
+        # map keeps the chunk order, so rows stay indexed by source vertex
+        for part in pool.map(_worker_rows, _chunks(len(positions), chunk_size)):
+            rows.extend([(j, MovementType(code)) for j, code in row] for row in part)
+    return rows
+
+
+class BackgroundEdges(object):
+    """All the edges of a graph built by :workers other processes while the caller goes on.
+
+    The edge checks are Python code holding the GIL, in a thread they would
+    stall the game loop just the same. The workers are daemon processes of a
+    multiprocessing.Pool, so an unfinished build never keeps the program
+    from exiting. They send back the CSR arrays, edge costs included.
+
+    The RoutingTable (:routes) or the ClusterGraph costs (:cluster_size) need
+    every row, so one worker builds them from the merged arrays afterwards.
+    """
+
+    def __init__(self, grid: TileGrid, properties: model.Properties, positions: List[Tuple[int, int]],
+                 workers=1, chunk_size=64, routes=False, cluster_size=0):
+        self.build_routes = routes
+        self.cluster_size = 0 if routes else cluster_size
+        self.pool = multiprocessing.Pool(max(workers, 1), initializer=_init_worker,
+                                         initargs=_worker_args(grid, properties, positions))
+        self.result = self.pool.map_async(_worker_edge_arrays, _chunks(len(positions), chunk_size))
+        self.csr = None
+        self.paths = None
+        if not (self.build_routes or self.cluster_size):
+            self.pool.close()
+
+    def done(self):
+        """Whether everything is built; merges the edges and starts the path tables once the rows are in"""
+        if self.csr is None:
+            if not self.result.ready():
+                return False
+            self.csr = csr_arrays([row for part in self.result.get() for row in part])
+            if self.build_routes or self.cluster_size:
+                self.paths = self.pool.apply_async(_worker_paths, (self.csr, self.build_routes, self.cluster_size))
+                self.pool.close()
+        return self.paths is None or self.paths.ready()
+
+    def arrays(self):
+        """(offsets, targets, move_codes, costs) as csr_arrays returns them, once done"""
+        return self.csr
+
+    def routes(self) -> Optional[RoutingTable]:
+        return self.paths.get() if self.build_routes else None
+
+    def cluster_costs(self):
+        """ClusterGraph.intra of the cluster size asked for, None if there was none"""
+        return self.paths.get() if self.cluster_size else None
@@ -0,0 +1,140 @@
+"""On-disk cache of navigation graphs.
+
+The graph depends only on the level tiles and the jump physics, and the
+same few maps come up game after game. A built graph is stored under the
+hash of both as two .npy arrays, loaded on the next game:
+    <key>.vertices.npy - (V, 2) int32 cells of the vertices;
+    <key>.edges.npy    - (E, 3) int32 rows of source, target, MovementType.
+The RoutingTable of a graph, when it's used, goes along as
+<key>.next_hop.npy and <key>.distance.npy.
+
+Caches for recorded levels can be built ahead of time:
+
+    python graph_cache.py LEVELS_DIR [--cache graph_cache]
+
+where every file of LEVELS_DIR holds a model.Game written by Game.write_to
+(see save_game).
+"""
+import argparse
+import hashlib
+import io
+import os
+import struct
+import sys
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import model
+from graph_builder import JumpPhysics
+from movements import MovementType
+from routing_table import RoutingTable
+from stream_wrapper import StreamWrapper, BytesStreamWrapper
+from tile_grid import TileGrid
+
+# Bump when the graph building rules, the edge costs or the stored arrays
+# change, old cache files are then never hit
+FORMAT_VERSION = 2
+
+
+def graph_key(game: model.Game) -> str:
+    grid = TileGrid.of(game.level)
+    digest = hashlib.sha1()
+    digest.update(struct.pack('<iii', FORMAT_VERSION, grid.height, grid.width))
+    digest.update(grid.tiles.tobytes())
+    digest.update(struct.pack('<4d', *JumpPhysics.of(game.properties).to_tuple()))
+    return digest.hexdigest()
+
+
+class GraphCache(object):
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _paths(self, key, names):
+        return [os.path.join(self.directory, '{}.{}.npy'.format(key, name)) for name in names]
+
+    def _load(self, game, names):
+        try:
+            return [np.load(path) for path in self._paths(graph_key(game), names)]
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, game, names, arrays):
+        os.makedirs(self.directory, exist_ok=True)
+        for path, array in zip(self._paths(graph_key(game), names), arrays):
+            # Written aside and renamed, a concurrent game never loads a partial file
+            temp_path = '{}.{}.tmp'.format(path, os.getpid())
+            with open(temp_path, 'wb') as file:
+                np.save(file, array)
+            os.replace(temp_path, path)
+
+    def contains(self, game: model.Game, routes=False) -> bool:
+        """Whether the graph of :game, and its RoutingTable if :routes, is cached, without loading it"""
+        names = ('vertices', 'edges', 'next_hop', 'distance') if routes else ('vertices', 'edges')
+        return all(os.path.isfile(path) for path in self._paths(graph_key(game), names))
+
+    def load(self, game: model.Game) -> Optional[Tuple[List[Tuple[int, int]], List[List[Tuple[int, MovementType]]]]]:
+        """Vertex cells and edge rows of the cached graph of :game, None on a miss"""
+        arrays = self._load(game, ('vertices', 'edges'))
+        if arrays is None:
+            return None
+        vertices, edges = arrays
+        positions = [(x, y) for x, y in vertices.tolist()]
+        rows = [[] for _ in positions]
+        move_types = {move_type.value: move_type for move_type in MovementType}
+        for i, j, code in edges.tolist():
+            rows[i].append((j, move_types[code]))
+        return positions, rows
+
+    def save(self, game: model.Game, positions: List[Tuple[int, int]], edges: List[Tuple[int, int, int]]):
+        """Store the graph of :game; :edges - (source, target, MovementType value)"""
+        self._save(game, ('vertices', 'edges'), (np.array(positions, dtype=np.int32).reshape(-1, 2),
+                                                  np.array(edges, dtype=np.int32).reshape(-1, 3)))
+
+    def load_routes(self, game: model.Game) -> Optional[RoutingTable]:
+        arrays = self._load(game, ('next_hop', 'distance'))
+        return RoutingTable(*arrays) if arrays is not None else None
+
+    def save_routes(self, game: model.Game, routes: RoutingTable):
+        self._save(game, ('next_hop', 'distance'), (routes.next_hop, routes.distance))
+
+
+def save_game(game: model.Game, path):
+    data = io.BytesIO()
+    game.write_to(StreamWrapper(data))
+    with open(path, 'wb') as file:
+        file.write(data.getvalue())
+
+
+def load_game(path) -> model.Game:
+    with open(path, 'rb') as file:
+        return model.Game.read_from(BytesStreamWrapper(file.read()))
+
+
+def main():
+    from my_strategy import MyStrategy
+
+    parser = argparse.ArgumentParser(description='Precompute navigation graph caches for recorded levels')
+    parser.add_argument('levels', help='directory of files with a model.Game each')
+    parser.add_argument('--cache', default='graph_cache')
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--routes', action='store_true', help='also precompute the all-pairs routing tables')
+    args = parser.parse_args()
+
+    strategy = MyStrategy(args.workers, graph_cache=args.cache, routes=args.routes, background_graph=False)
+    for name in sorted(os.listdir(args.levels)):
+        path = os.path.join(args.levels, name)
+        if not os.path.isfile(path):
+            continue
+        try:
+            game = load_game(path)
+        except (IOError, ValueError, struct.error) as e:
+            print('{}: skipped, {}'.format(name, e), file=sys.stderr)
+            continue
+        graph = strategy.make_graph(game)
+        print('{}: {} vertices, {} edges, key {}'.format(
+            name, len(graph.vertexes), len(graph.edge_list()), graph_key(game)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Translation-invariant jump arcs.
+
+The jump of JumpParams depends only on the (dx, dy) offset between two
+cells and on the physics Properties, not on where it starts. So for every
+integer offset the arc is traced once: its middle point and the relative
+cells whose edges it crosses (the cells that block it when solid). Checking
+a jump between two vertices is then a lookup of those cells in the solid
+mask of the TileGrid, shared by all vertices of the level.
+"""
+import math
+
+import model
+from movements import JumpParams
+from primitives import Line, tile_edges
+from tile_grid import TileGrid
+
+
+class JumpTemplate(object):
+    __slots__ = ('middle', 'cells', 'time')
+
+    def __init__(self, middle, cells, time):
+        self.middle = middle  # (dx, dy) of the highest point relative to the start
+        self.cells = cells  # (dx, dy) of the cells that block the jump when solid
+        self.time = time  # seconds of flight: rise to the middle point, then fall
+
+
+class JumpTemplates(object):
+    def __init__(self, properties: model.Properties):
+        self.properties = properties
+        self.templates = {}
+
+    def get(self, dx, dy):
+        """Template of the jump by (:dx, :dy), None if JumpParams can't make it"""
+        key = (dx, dy)
+        if key not in self.templates:
+            self.templates[key] = self._trace(dx, dy)
+        return self.templates[key]
+
+    def _trace(self, dx, dy):
+        jump = JumpParams.get_jump(model.Vec2Double(0, 0), model.Vec2Double(dx, dy), self.properties)
+        if not jump:
+            return None
+        middle = jump.middle_position
+        # Same cell window as is_jump_path_clear; floor instead of int as offsets may be negative
+        row_from = min(0, dy, math.floor(middle.y))
+        row_to = max(0, dy, math.floor(middle.y))
+        col_from = min(0, dx, math.floor(middle.x))
+        col_to = max(0, dx, math.floor(middle.x))
+
+        jump_line1 = Line(jump.from_position, middle)
+        jump_line2 = Line(middle, jump.to_position)
+
+        def crosses(edge):
+            return jump_line1.crosses_edge(*edge) or jump_line2.crosses_edge(*edge)
+
+        cells = []
+        for y in range(row_from, row_to):
+            for x in range(col_from, col_to + 1):
+                left, bottom, top, right = tile_edges(x, y)
+                if (y != 0 and y != dy and crosses(top)) or crosses(bottom) or crosses(left) or crosses(right):
+                    cells.append((x, y))
+
+        props = self.properties
+        rise_time = JumpParams.get_rise_time(math.fabs(dx), math.fabs(jump.to_position.y), props)
+        fall_time = max(math.fabs(dx) - math.fabs(middle.x), 0) / props.unit_max_horizontal_speed
+        fall_time = max(fall_time, (middle.y - jump.to_position.y) / props.unit_fall_speed)
+        return JumpTemplate((middle.x, middle.y), tuple(cells), rise_time + fall_time)
+
+    def is_clear(self, grid: TileGrid, from_x, from_y, to_x, to_y):
+        """Whether the jump between two cells of :grid isn't blocked by a solid tile"""
+        template = self.get(to_x - from_x, to_y - from_y)
+        if template is None:
+            return False
+        middle_x, middle_y = template.middle
+        if int(from_x + middle_x) < 0 or int(from_y + middle_y) < 0:
+            # A window starting left of (below) the map wraps around in the slicing of
+            # is_jump_path_clear, that isn't translation-invariant
+            return JumpParams.is_jump_path_clear(model.Vec2Double(from_x, from_y), model.Vec2Double(to_x, to_y),
+                                                 self.properties, grid)
+        solid_rows = grid.solid_rows
+        for dx, dy in template.cells:
+            x = from_x + dx
+            y = from_y + dy
+            if 0 <= y < grid.height and 0 <= x < grid.width and solid_rows[y][x]:
+                return False
+        return True
+
+    _libraries = {}
+
+    @staticmethod
+    def of(properties: model.Properties) -> 'JumpTemplates':
+        """Templates shared by every level with the same jump physics"""
+        key = (properties.unit_max_horizontal_speed, properties.unit_jump_speed,
+               properties.unit_fall_speed, properties.unit_jump_time)
+        library = JumpTemplates._libraries.get(key)
+        if library is None:
+            library = JumpTemplates(properties)
+            JumpTemplates._libraries[key] = library
+        return library
@@ -1,30 +1,46 @@
 import model
-from stream_wrapper import StreamWrapper
+import model_codecs
+from stream_wrapper import StreamWrapper, BufferedStreamWrapper
 from debug import Debug
+from game_decoder import GameDecoder
 from my_strategy import MyStrategy
+import os
 import socket
 import sys
 
 
 class Runner:
-    def __init__(self, host, port, token):
+    def __init__(self, host, port, token, graph_workers=0, lazy_graph=False, graph_cache=None, routes=False,
+                 cluster_size=0, background_graph=True, reuse_units=False):
+        self.reuse_units = reuse_units
+        self.graph_workers = graph_workers
+        self.lazy_graph = lazy_graph
+        self.graph_cache = graph_cache
+        self.routes = routes
+        self.cluster_size = cluster_size
+        self.background_graph = background_graph
         self.socket = socket.socket()
         self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, True)
         self.socket.connect((host, port))
         socket_stream = self.socket.makefile('rwb')
-        self.reader = StreamWrapper(socket_stream)
+        self.reader = BufferedStreamWrapper(socket_stream)
         self.writer = StreamWrapper(socket_stream)
         self.token = token
         self.writer.write_string(self.token)
         self.writer.flush()
 
     def run(self):
-        strategy = MyStrategy()
+        strategy = MyStrategy(self.graph_workers, self.lazy_graph, self.graph_cache, self.routes,
+                              self.cluster_size, self.background_graph)
         debug = Debug(self.writer)
+        decoder = GameDecoder(reuse_units=self.reuse_units)
 
         while True:
-            message = model.ServerMessageGame.read_from(self.reader)
+            message = decoder.read_message(self.reader)
             if message.player_view is None:
+                print('decoder: {}'.format(decoder.stats()))
+                if strategy.graph is not None:
+                    print('graph: {}'.format(strategy.graph.stats()))
                 break
             player_view = message.player_view
             actions = {}
@@ -41,4 +57,17 @@ if __name__ == "__main__":
     host = "127.0.0.1" if len(sys.argv) < 2 else sys.argv[1]
     port = 31001 if len(sys.argv) < 3 else int(sys.argv[2])
     token = "0000000000000000" if len(sys.argv) < 4 else sys.argv[3]
-    Runner(host, port, token).run()
+    # MODEL_CODEC=original switches back to the field by field model codecs
+    model_codecs.use_generated_codecs(os.environ.get("MODEL_CODEC", "generated") == "generated")
+    # DECODER_REUSE_UNITS=1 updates the Unit objects of the previous tick in place instead of decoding new ones
+    # GRAPH_WORKERS=n builds the navigation graph in n processes,
+    # GRAPH_LAZY=1 computes its edges only as path searches reach them,
+    # GRAPH_CACHE=dir keeps built graphs in dir for the next games,
+    # GRAPH_ROUTES=1 precomputes the all-pairs routing table,
+    # GRAPH_CLUSTER_SIZE=n searches paths hierarchically over n x n cell clusters,
+    # GRAPH_BACKGROUND=0 builds the graph inside the first tick instead of in other processes
+    Runner(host, port, token, int(os.environ.get("GRAPH_WORKERS", "0")),
+           os.environ.get("GRAPH_LAZY", "0") == "1", os.environ.get("GRAPH_CACHE", ""),
+           os.environ.get("GRAPH_ROUTES", "0") == "1", int(os.environ.get("GRAPH_CLUSTER_SIZE", "0")),
+           os.environ.get("GRAPH_BACKGROUND", "1") == "1",
+           os.environ.get("DECODER_REUSE_UNITS", "0") == "1").run()
@@ -3,6 +3,7 @@ from .vec2_double import Vec2Double
 from .vec2_double import Vec2Double
 from .explosion_params import ExplosionParams
 class Bullet:
+    __slots__ = ('weapon_type', 'unit_id', 'player_id', 'position', 'velocity', 'damage', 'size', 'explosion_params')
     def __init__(self, weapon_type, unit_id, player_id, position, velocity, damage, size, explosion_params):
         self.weapon_type = weapon_type
         self.unit_id = unit_id
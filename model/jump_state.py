@@ -1,4 +1,5 @@
 class JumpState:
+    __slots__ = ('can_jump', 'speed', 'max_time', 'can_cancel')
     def __init__(self, can_jump, speed, max_time, can_cancel):
         self.can_jump = can_jump
         self.speed = speed
@@ -2,6 +2,7 @@ from .vec2_double import Vec2Double
 from .vec2_double import Vec2Double
 from .item import Item
 class LootBox:
+    __slots__ = ('position', 'size', 'item')
     def __init__(self, position, size, item):
         self.position = position
         self.size = size
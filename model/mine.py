@@ -3,6 +3,7 @@ from .vec2_double import Vec2Double
 from .mine_state import MineState
 from .explosion_params import ExplosionParams
 class Mine:
+    __slots__ = ('player_id', 'position', 'size', 'state', 'timer', 'trigger_radius', 'explosion_params')
     def __init__(self, player_id, position, size, state, timer, trigger_radius, explosion_params):
         self.player_id = player_id
         self.position = position
@@ -3,6 +3,7 @@ from .vec2_double import Vec2Double
 from .jump_state import JumpState
 from .weapon import Weapon
 class Unit:
+    __slots__ = ('player_id', 'id', 'health', 'position', 'size', 'jump_state', 'walked_right', 'stand', 'on_ground', 'on_ladder', 'mines', 'weapon')
     def __init__(self, player_id, id, health, position, size, jump_state, walked_right, stand, on_ground, on_ladder, mines, weapon):
         self.player_id = player_id
         self.id = id
@@ -1,5 +1,6 @@
 from .vec2_double import Vec2Double
 class UnitAction:
+    __slots__ = ('velocity', 'jump', 'jump_down', 'aim', 'shoot', 'reload', 'swap_weapon', 'plant_mine')
     def __init__(self, velocity, jump, jump_down, aim, shoot, reload, swap_weapon, plant_mine):
         self.velocity = velocity
         self.jump = jump
@@ -1,6 +1,7 @@
 from .weapon_type import WeaponType
 from .weapon_params import WeaponParams
 class Weapon:
+    __slots__ = ('typ', 'params', 'magazine', 'was_shooting', 'spread', 'fire_timer', 'last_angle', 'last_fire_tick')
     def __init__(self, typ, params, magazine, was_shooting, spread, fire_timer, last_angle, last_fire_tick):
         self.typ = typ
         self.params = params
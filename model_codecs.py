@@ -0,0 +1,516 @@
+"""Generated struct codecs for the model package.
+
+Every model class decodes field by field through separate StreamWrapper
+calls. Here each type is described by a schema, and a generator turns it
+into read_from/write_to functions where every run of fixed-size fields
+(including nested fixed structs like Vec2Double or JumpState) is read or
+written with one precompiled struct.Struct. Optional values, lists, maps
+and variant fields break the runs.
+
+use_generated_codecs(True) installs the generated functions on the model
+classes, use_generated_codecs(False) puts the original ones back.
+"""
+import struct
+from functools import lru_cache
+
+import model
+from model import item
+
+
+INT = 'i'
+LONG = 'q'
+FLOAT = 'f'
+DOUBLE = 'd'
+BOOL = '?'
+
+
+class Enum(object):
+    def __init__(self, enum_type):
+        self.enum_type = enum_type
+
+
+class Optional(object):
+    def __init__(self, inner):
+        self.inner = inner
+
+
+class List(object):
+    def __init__(self, inner):
+        self.inner = inner
+
+
+class Map(object):
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+
+class Variant(object):
+    def __init__(self, base, cases):
+        self.base = base
+        self.cases = cases
+
+
+# Field lists in wire order, which is also the constructor argument order.
+# Variants (Item) are read and written through their own read_from/write_to
+# and break the fixed-size runs.
+SCHEMAS = {
+    model.Vec2Double: [('x', DOUBLE), ('y', DOUBLE)],
+    model.JumpState: [('can_jump', BOOL), ('speed', DOUBLE), ('max_time', DOUBLE), ('can_cancel', BOOL)],
+    model.BulletParams: [('speed', DOUBLE), ('size', DOUBLE), ('damage', INT)],
+    model.ExplosionParams: [('radius', DOUBLE), ('damage', INT)],
+    model.WeaponParams: [
+        ('magazine_size', INT), ('fire_rate', DOUBLE), ('reload_time', DOUBLE), ('min_spread', DOUBLE),
+        ('max_spread', DOUBLE), ('recoil', DOUBLE), ('aim_speed', DOUBLE), ('bullet', model.BulletParams),
+        ('explosion', Optional(model.ExplosionParams)),
+    ],
+    model.Properties: [
+        ('max_tick_count', INT), ('team_size', INT), ('ticks_per_second', DOUBLE), ('updates_per_tick', INT),
+        ('loot_box_size', model.Vec2Double), ('unit_size', model.Vec2Double),
+        ('unit_max_horizontal_speed', DOUBLE), ('unit_fall_speed', DOUBLE), ('unit_jump_time', DOUBLE),
+        ('unit_jump_speed', DOUBLE), ('jump_pad_jump_time', DOUBLE), ('jump_pad_jump_speed', DOUBLE),
+        ('unit_max_health', INT), ('health_pack_health', INT),
+        ('weapon_params', Map(Enum(model.WeaponType), model.WeaponParams)),
+        ('mine_size', model.Vec2Double), ('mine_explosion_params', model.ExplosionParams),
+        ('mine_prepare_time', DOUBLE), ('mine_trigger_time', DOUBLE), ('mine_trigger_radius', DOUBLE),
+        ('kill_score', INT),
+    ],
+    model.Level: [('tiles', List(List(Enum(model.Tile))))],
+    model.Player: [('id', INT), ('score', INT)],
+    model.Weapon: [
+        ('typ', Enum(model.WeaponType)), ('params', model.WeaponParams), ('magazine', INT),
+        ('was_shooting', BOOL), ('spread', DOUBLE), ('fire_timer', Optional(DOUBLE)),
+        ('last_angle', Optional(DOUBLE)), ('last_fire_tick', Optional(INT)),
+    ],
+    model.Unit: [
+        ('player_id', INT), ('id', INT), ('health', INT), ('position', model.Vec2Double),
+        ('size', model.Vec2Double), ('jump_state', model.JumpState), ('walked_right', BOOL), ('stand', BOOL),
+        ('on_ground', BOOL), ('on_ladder', BOOL), ('mines', INT), ('weapon', Optional(model.Weapon)),
+    ],
+    model.Bullet: [
+        ('weapon_type', Enum(model.WeaponType)), ('unit_id', INT), ('player_id', INT),
+        ('position', model.Vec2Double), ('velocity', model.Vec2Double), ('damage', INT), ('size', DOUBLE),
+        ('explosion_params', Optional(model.ExplosionParams)),
+    ],
+    model.Mine: [
+        ('player_id', INT), ('position', model.Vec2Double), ('size', model.Vec2Double),
+        ('state', Enum(model.MineState)), ('timer', Optional(DOUBLE)), ('trigger_radius', DOUBLE),
+        ('explosion_params', model.ExplosionParams),
+    ],
+    item.HealthPack: [('health', INT)],
+    item.Weapon: [('weapon_type', Enum(model.WeaponType))],
+    item.Mine: [],
+    model.LootBox: [
+        ('position', model.Vec2Double), ('size', model.Vec2Double),
+        ('item', Variant(model.Item, [item.HealthPack, item.Weapon, item.Mine])),
+    ],
+    model.Game: [
+        ('current_tick', INT), ('properties', model.Properties), ('level', model.Level),
+        ('players', List(model.Player)), ('units', List(model.Unit)), ('bullets', List(model.Bullet)),
+        ('mines', List(model.Mine)), ('loot_boxes', List(model.LootBox)),
+    ],
+    model.PlayerView: [('my_id', INT), ('game', model.Game)],
+    model.ServerMessageGame: [('player_view', Optional(model.PlayerView))],
+    model.UnitAction: [
+        ('velocity', DOUBLE), ('jump', BOOL), ('jump_down', BOOL), ('aim', model.Vec2Double),
+        ('shoot', BOOL), ('reload', BOOL), ('swap_weapon', BOOL), ('plant_mine', BOOL),
+    ],
+}
+
+# Variant classes write their discriminant before the fields
+TAGGED = (item.HealthPack, item.Weapon, item.Mine)
+
+
+@lru_cache(maxsize=None)
+def array_struct(fmt, count):
+    """Struct for :count consecutive values of a single format char"""
+    return struct.Struct('<' + fmt * count)
+
+
+def fixed_format(kind):
+    """Struct format of a kind if it always has the same size, else None"""
+    if isinstance(kind, str):
+        return kind
+    if isinstance(kind, Enum):
+        return INT
+    if kind in SCHEMAS:
+        formats = [fixed_format(field_kind) for _, field_kind in SCHEMAS[kind]]
+        if None not in formats:
+            return ''.join(formats)
+    return None
+
+
+class _Emitter(object):
+    def __init__(self):
+        self.lines = []
+        self.namespace = {'array_struct': array_struct}
+        self.refs = {}
+        self.pending_formats = []
+        self.pending_values = []
+        self.counter = 0
+
+    def new_var(self):
+        self.counter += 1
+        return 'v{}'.format(self.counter)
+
+    def ref(self, obj):
+        if id(obj) not in self.refs:
+            name = '_{}{}'.format(getattr(obj, '__name__', 'S'), len(self.refs))
+            self.refs[id(obj)] = name
+            self.namespace[name] = obj
+        return self.refs[id(obj)]
+
+    def emit(self, indent, line):
+        self.lines.append('    ' * indent + line)
+
+    def source(self, name, args):
+        return 'def {}({}):\n{}\n'.format(name, args, '\n'.join(self.lines))
+
+
+class _ReadEmitter(_Emitter):
+    def flush(self, indent):
+        if not self.pending_values:
+            return
+        fmt = self.ref(struct.Struct('<' + ''.join(self.pending_formats)))
+        self.emit(indent, '{}, = stream.read_struct({})'.format(', '.join(self.pending_values), fmt))
+        self.pending_formats = []
+        self.pending_values = []
+
+    def primitive(self, fmt):
+        var = self.new_var()
+        self.pending_formats.append(fmt)
+        self.pending_values.append(var)
+        return var
+
+    def value(self, kind, indent):
+        """Emit reading code for :kind, return the expression of its value"""
+        if isinstance(kind, str):
+            return self.primitive(kind)
+        if isinstance(kind, Enum):
+            return '{}({})'.format(self.ref(kind.enum_type), self.primitive(INT))
+        if isinstance(kind, Optional):
+            flag = self.primitive(BOOL)
+            self.flush(indent)
+            var = self.new_var()
+            self.emit(indent, 'if {}:'.format(flag))
+            expr = self.value(kind.inner, indent + 1)
+            self.flush(indent + 1)
+            self.emit(indent + 1, '{} = {}'.format(var, expr))
+            self.emit(indent, 'else:')
+            self.emit(indent + 1, '{} = None'.format(var))
+            return var
+        if isinstance(kind, List):
+            count = self.primitive(INT)
+            self.flush(indent)
+            var = self.new_var()
+            inner = kind.inner
+            if isinstance(inner, (str, Enum)):
+                # Whole list of scalars in one unpack
+                raw = 'stream.read_struct(array_struct({!r}, {}))'.format(fixed_format(inner), count)
+                if isinstance(inner, Enum):
+                    # dict lookup is several times cheaper than calling the enum class
+                    members = {member.value: member for member in inner.enum_type}
+                    self.emit(indent, '{} = list(map({}, {}))'.format(var, self.ref(members.__getitem__), raw))
+                else:
+                    self.emit(indent, '{} = list({})'.format(var, raw))
+                return var
+            self.emit(indent, '{} = []'.format(var))
+            self.emit(indent, 'for _ in range({}):'.format(count))
+            expr = self.value(inner, indent + 1)
+            self.flush(indent + 1)
+            self.emit(indent + 1, '{}.append({})'.format(var, expr))
+            return var
+        if isinstance(kind, Map):
+            count = self.primitive(INT)
+            self.flush(indent)
+            var = self.new_var()
+            self.emit(indent, '{} = {{}}'.format(var))
+            self.emit(indent, 'for _ in range({}):'.format(count))
+            key = self.value(kind.key, indent + 1)
+            value = self.value(kind.value, indent + 1)
+            self.flush(indent + 1)
+            self.emit(indent + 1, '{}[{}] = {}'.format(var, key, value))
+            return var
+        if isinstance(kind, Variant):
+            self.flush(indent)
+            var = self.new_var()
+            self.emit(indent, '{} = {}.read_from(stream)'.format(var, self.ref(kind.base)))
+            return var
+        args = [self.value(field_kind, indent) for _, field_kind in SCHEMAS[kind]]
+        return '{}({})'.format(self.ref(kind), ', '.join(args))
+
+
+class _ReadIntoEmitter(_ReadEmitter):
+    """Reads a value into an existing object, reusing its nested objects"""
+
+    def __init__(self):
+        super().__init__()
+        self.pending_assignments = []
+
+    def flush(self, indent):
+        super().flush(indent)
+        for assignment_indent, line in self.pending_assignments:
+            self.emit(assignment_indent, line)
+        self.pending_assignments = []
+
+    def assign(self, cls, target, indent):
+        """Emit code updating the fields of the :cls object :target in place"""
+        for name, kind in SCHEMAS[cls]:
+            field = '{}.{}'.format(target, name)
+            if kind in SCHEMAS:
+                var = self.new_var()
+                self.pending_assignments.append((indent, '{} = {}'.format(var, field)))
+                self.assign(kind, var, indent)
+            elif isinstance(kind, Optional) and kind.inner in SCHEMAS:
+                flag = self.primitive(BOOL)
+                self.flush(indent)
+                var = self.new_var()
+                self.emit(indent, 'if {}:'.format(flag))
+                self.emit(indent + 1, '{} = {}'.format(var, field))
+                self.emit(indent + 1, 'if {} is None:'.format(var))
+                expr = self.value(kind.inner, indent + 2)
+                self.flush(indent + 2)
+                self.emit(indent + 2, '{} = {}'.format(field, expr))
+                self.emit(indent + 1, 'else:')
+                self.assign(kind.inner, var, indent + 2)
+                self.flush(indent + 2)
+                self.emit(indent, 'else:')
+                self.emit(indent + 1, '{} = None'.format(field))
+            else:
+                expr = self.value(kind, indent)
+                self.pending_assignments.append((indent, '{} = {}'.format(field, expr)))
+
+
+class _WriteEmitter(_Emitter):
+    def flush(self, indent):
+        if not self.pending_values:
+            return
+        fmt = self.ref(struct.Struct('<' + ''.join(self.pending_formats)))
+        self.emit(indent, 'stream.write_struct({}, {})'.format(fmt, ', '.join(self.pending_values)))
+        self.pending_formats = []
+        self.pending_values = []
+
+    def primitive(self, fmt, expr):
+        self.pending_formats.append(fmt)
+        self.pending_values.append(expr)
+
+    def value(self, kind, expr, indent):
+        """Emit writing code for the value of :expr"""
+        if isinstance(kind, str):
+            self.primitive(kind, expr)
+        elif isinstance(kind, Enum):
+            self.primitive(INT, expr)
+        elif isinstance(kind, Optional):
+            var = self.new_var()
+            self.emit(indent, '{} = {}'.format(var, expr))
+            self.primitive(BOOL, '{} is not None'.format(var))
+            self.flush(indent)
+            self.emit(indent, 'if {} is not None:'.format(var))
+            self.value(kind.inner, var, indent + 1)
+            self.flush(indent + 1)
+        elif isinstance(kind, List):
+            var = self.new_var()
+            self.emit(indent, '{} = {}'.format(var, expr))
+            self.primitive(INT, 'len({})'.format(var))
+            self.flush(indent)
+            inner = kind.inner
+            if isinstance(inner, (str, Enum)):
+                self.emit(indent, 'stream.write_struct(array_struct({!r}, len({})), *{})'.format(
+                    fixed_format(inner), var, var))
+            else:
+                element = self.new_var()
+                self.emit(indent, 'for {} in {}:'.format(element, var))
+                self.value(inner, element, indent + 1)
+                self.flush(indent + 1)
+        elif isinstance(kind, Map):
+            var = self.new_var()
+            self.emit(indent, '{} = {}'.format(var, expr))
+            self.primitive(INT, 'len({})'.format(var))
+            self.flush(indent)
+            key, value = self.new_var(), self.new_var()
+            self.emit(indent, 'for {}, {} in {}.items():'.format(key, value, var))
+            self.value(kind.key, key, indent + 1)
+            self.value(kind.value, value, indent + 1)
+            self.flush(indent + 1)
+        elif isinstance(kind, Variant):
+            self.flush(indent)
+            self.emit(indent, '{}.write_to(stream)'.format(expr))
+        else:
+            if len(SCHEMAS[kind]) > 1 and '.' in expr:
+                var = self.new_var()
+                self.emit(indent, '{} = {}'.format(var, expr))
+                expr = var
+            for name, field_kind in SCHEMAS[kind]:
+                self.value(field_kind, '{}.{}'.format(expr, name), indent)
+
+
+class _RawReadEmitter(_Emitter):
+    """Copies the wire bytes of a value into a chunk list without decoding it"""
+
+    def flush(self, indent):
+        if not self.pending_formats:
+            return
+        chunk = self.new_var()
+        self.emit(indent, '{} = stream.read_bytes({})'.format(chunk, struct.calcsize('<' + ''.join(self.pending_formats))))
+        self.emit(indent, 'chunks.append({})'.format(chunk))
+        # Counts and presence flags are the only values we need to look at
+        for var, fmt, offset in self.pending_values:
+            self.emit(indent, '{}, = {}.unpack_from({}, {})'.format(
+                var, self.ref(struct.Struct('<' + fmt)), chunk, offset))
+        self.pending_formats = []
+        self.pending_values = []
+
+    def primitive(self, fmt, needed=False):
+        offset = struct.calcsize('<' + ''.join(self.pending_formats))
+        self.pending_formats.append(fmt)
+        if needed:
+            var = self.new_var()
+            self.pending_values.append((var, fmt, offset))
+            return var
+
+    def value(self, kind, indent):
+        """Emit code copying the bytes of a :kind value"""
+        if isinstance(kind, str):
+            self.primitive(kind)
+        elif isinstance(kind, Enum):
+            self.primitive(INT)
+        elif isinstance(kind, Optional):
+            flag = self.primitive(BOOL, needed=True)
+            self.flush(indent)
+            self.emit(indent, 'if {}:'.format(flag))
+            self.value(kind.inner, indent + 1)
+            self.flush(indent + 1)
+        elif isinstance(kind, List):
+            count = self.primitive(INT, needed=True)
+            self.flush(indent)
+            fmt = fixed_format(kind.inner)
+            if fmt is not None:
+                self.emit(indent, 'chunks.append(stream.read_bytes({} * {}))'.format(
+                    count, struct.calcsize('<' + fmt)))
+            else:
+                self.emit(indent, 'for _ in range({}):'.format(count))
+                self.value(kind.inner, indent + 1)
+                self.flush(indent + 1)
+        elif isinstance(kind, Map):
+            count = self.primitive(INT, needed=True)
+            self.flush(indent)
+            self.emit(indent, 'for _ in range({}):'.format(count))
+            self.value(kind.key, indent + 1)
+            self.value(kind.value, indent + 1)
+            self.flush(indent + 1)
+        elif isinstance(kind, Variant):
+            tag = self.primitive(INT, needed=True)
+            self.flush(indent)
+            for i, case in enumerate(kind.cases):
+                self.emit(indent, '{} {} == {}:'.format('if' if i == 0 else 'elif', tag, case.TAG))
+                self.value(case, indent + 1)
+                self.flush(indent + 1)
+                if not SCHEMAS[case]:
+                    self.emit(indent + 1, 'pass')
+            self.emit(indent, 'else:')
+            self.emit(indent + 1, 'raise Exception("Unexpected discriminant value")')
+        else:
+            for _, field_kind in SCHEMAS[kind]:
+                self.value(field_kind, indent)
+
+
+def generate_read(cls):
+    """Build the read_from function for :cls, return (function, source)"""
+    emitter = _ReadEmitter()
+    expr = emitter.value(cls, 1)
+    emitter.flush(1)
+    emitter.emit(1, 'return {}'.format(expr))
+    return _compile(emitter, 'read_from', 'stream')
+
+
+def generate_write(cls):
+    """Build the write_to method for :cls, return (function, source)"""
+    emitter = _WriteEmitter()
+    if cls in TAGGED:
+        emitter.primitive(INT, 'self.TAG')
+    for name, field_kind in SCHEMAS[cls]:
+        emitter.value(field_kind, 'self.{}'.format(name), 1)
+    emitter.flush(1)
+    if not emitter.lines:
+        emitter.emit(1, 'pass')
+    return _compile(emitter, 'write_to', 'self, stream')
+
+
+@lru_cache(maxsize=None)
+def into_reader(cls):
+    """Function (obj, stream) decoding the next :cls value into the existing :obj"""
+    emitter = _ReadIntoEmitter()
+    emitter.assign(cls, 'obj', 1)
+    emitter.flush(1)
+    emitter.emit(1, 'return obj')
+    return _compile(emitter, 'read_into', 'obj, stream')[0]
+
+
+@lru_cache(maxsize=None)
+def raw_reader(cls):
+    """Function (stream, chunks) appending the wire bytes of one :cls value to chunks"""
+    emitter = _RawReadEmitter()
+    emitter.value(cls, 1)
+    emitter.flush(1)
+    return _compile(emitter, 'read_raw', 'stream, chunks')[0]
+
+
+def read_raw(cls, stream):
+    """Wire bytes of the next :cls value in the stream"""
+    chunks = []
+    raw_reader(cls)(stream, chunks)
+    return b''.join(chunks)
+
+
+def field_offset(cls, name):
+    """Byte offset of a field inside a :cls value, None if it follows variable-size fields"""
+    offset = 0
+    for field_name, field_kind in SCHEMAS[cls]:
+        if field_name == name:
+            return offset
+        fmt = fixed_format(field_kind)
+        if fmt is None:
+            return None
+        offset += struct.calcsize('<' + fmt)
+    raise KeyError(name)
+
+
+def count_objects(value, kind=None):
+    """Number of model instances, lists and dicts a decoded value is made of"""
+    if kind is None:
+        kind = type(value)
+    if value is None or isinstance(kind, (str, Enum)):
+        return 0
+    if isinstance(kind, Optional):
+        return count_objects(value, kind.inner)
+    if isinstance(kind, List):
+        return 1 + sum(count_objects(element, kind.inner) for element in value)
+    if isinstance(kind, Map):
+        return 1 + sum(count_objects(element, kind.value) for element in value.values())
+    if isinstance(kind, Variant):
+        return count_objects(value, type(value))
+    return 1 + sum(count_objects(getattr(value, name), field_kind) for name, field_kind in SCHEMAS[kind])
+
+
+def _compile(emitter, name, args):
+    source = emitter.source(name, args)
+    namespace = dict(emitter.namespace)
+    exec(compile(source, '<model_codecs {}>'.format(name), 'exec'), namespace)
+    return namespace[name], source
+
+
+_original = {}
+
+
+def use_generated_codecs(enabled=True):
+    """Switch every model class in SCHEMAS between generated and original codecs"""
+    for cls in SCHEMAS:
+        if cls not in _original:
+            _original[cls] = (cls.__dict__['read_from'], cls.__dict__['write_to'])
+        if enabled:
+            read_from, _ = generate_read(cls)
+            write_to, _ = generate_write(cls)
+            cls.read_from = staticmethod(read_from)
+            cls.write_to = write_to
+        else:
+            cls.read_from, cls.write_to = _original[cls]
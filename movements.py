@@ -1,12 +1,12 @@
 import math
 import enum
 import model
-from typing import List, Optional
+from typing import Optional
 from copy import deepcopy
 
-from my_strategy import LevelPoint
 from helper import is_same_position, get_sign, distance
-from primitives import Line
+from primitives import Line, tile_edges
+from tile_grid import TileGrid
 
 
 class MovementType(enum.Enum):
@@ -43,11 +43,8 @@ class JumpParams(MoveParam):
             dy = math.fabs(from_pos.y - to_pos.y)
 
             v_x = game_params.unit_max_horizontal_speed
-            v_up = game_params.unit_jump_speed
-            v_down = game_params.unit_fall_speed
 
-            time_1 = (dx + v_x * dy / v_down) * v_down /\
-                     (v_x * (v_down + v_up))
+            time_1 = JumpParams.get_rise_time(dx, dy, game_params)
             if time_1 > game_params.unit_jump_time:
                 return None
             return model.Vec2Double(
@@ -81,72 +78,92 @@ class JumpParams(MoveParam):
             self.jump_changed = True
         return not self.jump_changed and not is_same_position(position, self.middle_position)
 
+    @staticmethod
+    def get_rise_time(dx, dy, game_params: model.Properties):
+        """Time to the highest point of a jump by :dx, :dy (both not negative)"""
+        v_x = game_params.unit_max_horizontal_speed
+        v_up = game_params.unit_jump_speed
+        v_down = game_params.unit_fall_speed
+        return (dx + v_x * dy / v_down) * v_down /\
+            (v_x * (v_down + v_up))
+
     @staticmethod
     def get_jump_max_dy(game_props: model.Properties):
         return game_props.unit_jump_speed * game_props.unit_jump_time
 
+    @staticmethod
+    def get_jump_max_r(game_props: model.Properties):
+        unit_max_fall_time = (game_props.unit_jump_time * game_props.unit_max_horizontal_speed) /\
+            game_props.unit_fall_speed
+
+        return game_props.unit_jump_time * game_props.unit_max_horizontal_speed +\
+            game_props.unit_fall_speed * unit_max_fall_time
+
     @staticmethod
     def is_one_jump_avail(
             from_position: model.Vec2Double,
             to_position: model.Vec2Double,
-            game: model.Game,
-            tiles: List[List[LevelPoint]]
+            game: model.Game
     ):
-        def has_common_point(tile_line: Line, jump_line1: Line, jump_line2: Line):
-            common_point = tile_line.common_point_with(jump_line1)
-            if common_point and tile_line.is_inside(common_point):
-                return True
-            common_point = tile_line.common_point_with(jump_line2)
-            if common_point and tile_line.is_inside(common_point):
-                return True
-            return False
         max_dy = JumpParams.get_jump_max_dy(game.properties)
         if math.fabs(from_position.y - to_position.y) > max_dy:
             return False
 
-        unit_max_fall_time = (game.properties.unit_jump_time * game.properties.unit_max_horizontal_speed) /\
-            game.properties.unit_fall_speed
-
-        max_r = game.properties.unit_jump_time * game.properties.unit_max_horizontal_speed +\
-            game.properties.unit_fall_speed * unit_max_fall_time
+        max_r = JumpParams.get_jump_max_r(game.properties)
         if distance(from_position, to_position) > max_r:
             return False
 
+        return JumpParams.is_jump_path_clear(from_position, to_position, game.properties, TileGrid.of(game.level))
+
+    @staticmethod
+    def is_jump_path_clear(
+            from_position: model.Vec2Double,
+            to_position: model.Vec2Double,
+            game_props: model.Properties,
+            grid: TileGrid
+    ):
+        """Exact geometric check of a jump that already passed the reach limits"""
+        def has_common_point(edge, jump_line1: Line, jump_line2: Line):
+            return jump_line1.crosses_edge(*edge) or jump_line2.crosses_edge(*edge)
+
         jump = JumpParams.get_jump(
             from_position,
             to_position,
-            game.properties
+            game_props
         )
 
         if not jump:
             return False
 
-        row_count = int(max_dy) + 1
         row_from = min([int(from_position.y), int(to_position.y), int(jump.middle_position.y)])
         row_to = max([int(from_position.y), int(to_position.y), int(jump.middle_position.y)])
-        rows = tiles[row_from:row_to]  # type: List[List[LevelPoint]]
+        # Slicing ranges keeps the list slicing semantics of the old tile rows
+        rows = range(grid.height)[row_from:row_to]
 
-        col_count = int(max_r) + 1
         col_from = min([int(from_position.x), int(to_position.x), int(jump.middle_position.x)])
         col_to = max([int(from_position.x), int(to_position.x), int(jump.middle_position.x)])
 
+        if row_from >= 0 and col_from >= 0 and not grid.any_in('solid', col_from, row_from, col_to + 1, row_to):
+            return True
+
         jump_line1 = Line(jump.from_position, jump.middle_position)
         jump_line2 = Line(jump.middle_position, jump.to_position)
 
-        solid_tiles = [model.Tile.JUMP_PAD, model.Tile.WALL, model.Tile.PLATFORM]
-        for row in rows:  # type: List[LevelPoint]
-            solid_cells = [r for r in row[col_from:col_to+1] if r.tile in solid_tiles]
-            for cell in solid_cells:  # type: LevelPoint
-                if cell.position.x == 26. and cell.position.y == 9.:
-                    a = 1
-                if from_position.y != cell.position.y and to_position.y != cell.position.y\
-                        and has_common_point(cell.lines.top, jump_line1, jump_line2):
+        columns = range(grid.width)[col_from:col_to+1]
+        for y in rows:
+            solid_row = grid.solid_rows[y]
+            for x in columns:
+                if not solid_row[x]:
+                    continue
+                left, bottom, top, right = tile_edges(x, y)
+                if from_position.y != y and to_position.y != y\
+                        and has_common_point(top, jump_line1, jump_line2):
                     return False
-                if has_common_point(cell.lines.bottom, jump_line1, jump_line2):
+                if has_common_point(bottom, jump_line1, jump_line2):
                     return False
-                if has_common_point(cell.lines.left, jump_line1, jump_line2):
+                if has_common_point(left, jump_line1, jump_line2):
                     return False
-                if has_common_point(cell.lines.right, jump_line1, jump_line2):
+                if has_common_point(right, jump_line1, jump_line2):
                     return False
         return True
 
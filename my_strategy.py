@@ -1,10 +1,21 @@
-from typing import List
+import heapq
+from typing import List, Optional
 from collections import deque
 from datetime import datetime
 from primitives import LevelPoint
 
+import numpy as np
+
 import model
+from cluster_graph import ClusterGraph
+from distance_field import DistanceField
+from graph_builder import BackgroundEdges, EdgeBuilder, build_rows, csr_arrays, edge_arrays, snap_index
+from graph_cache import GraphCache
+from helper import distance_sqr, get_sign
 from movements import JumpParams, MoveParam, MovementType, Movement
+from replanner import Replanner
+from routing_table import RoutingTable
+from tile_grid import TileGrid
 
 
 class GraphVertex(object):
@@ -38,171 +49,296 @@ class GraphVertex(object):
 
 
 class Graph(object):
-    def __init__(self, game: model.Game, level: List[List[LevelPoint]], vertexes: list):
-        def build_matrix(vertices: List[LevelPoint], game: model.Game, level: List[List[LevelPoint]]):
-            _tiles = list(zip(*game.level.tiles))
-            matrix = []
-            # Строим матрицу смежности:
-            #     1. по всем вершинам ищем пешие пути
-            for i, v_from in enumerate(vertices):
-                self.vertexes_map[v_from.get_tuple()] = i
-                path_to = []
-                for v_to in vertices:
-                    if v_from.stred_position() != v_to.stred_position():
-                        if v_from.position.y == v_to.position.y and v_from.position.y > 0:
-                            max_x = max([v_from.position.x, v_to.position.x])
-                            min_x = min([v_from.position.x, v_to.position.x])
-
-                            tiles_between = _tiles[int(v_from.position.y)][min_x:max_x]
-                            tiles_under = _tiles[int(v_from.position.y - 1)][min_x:max_x]
-
-                            # if v_from.position.x == 36 and v_from.position.y == 1\
-                            #         and v_to.position.x > 25:
-                            #     a = 1
-
-                            if model.Tile.WALL not in tiles_between\
-                                    and model.Tile.JUMP_PAD not in tiles_between\
-                                    and model.Tile.EMPTY not in tiles_under:
-                                path_to.append(GraphVertex(v_from.position, v_to.position, MovementType.MOVE_TO, game))
-                            elif model.Tile.EMPTY in tiles_under:
-                                is_one_jump = JumpParams.is_one_jump_avail(
-                                    from_position=v_from.position,
-                                    to_position=v_to.position,
-                                    game=game,
-                                    tiles=level
-                                )
-                                if is_one_jump:
-                                    path_to.append(GraphVertex(v_from.position, v_to.position, MovementType.JUMP_TO, game))
-                                else:
-                                    path_to.append(None)
-                            elif model.Tile.JUMP_PAD in tiles_between:
-                                if JumpParams.is_one_jump_avail(v_from.position, v_to.position, game, level):
-                                    path_to.append(GraphVertex(v_from.position, v_to.position, MovementType.JUMP_TO, game))
-                                else:
-                                    path_to.append(None)
-                            elif model.Tile.WALL in tiles_between:
-                                is_one_jump = JumpParams.is_one_jump_avail(
-                                    from_position=v_from.position,
-                                    to_position=v_to.position,
-                                    game=game,
-                                    tiles=level
-                                )
-                                if is_one_jump:
-                                    path_to.append(GraphVertex(v_from.position, v_to.position, MovementType.JUMP_TO, game))
-                                else:
-                                    path_to.append(None)
-                            else:
-                                path_to.append(None)
-                        else:
-                            if v_from.position.x == 29 and v_to.position.x == 29:
-                                a = 1
-                            if JumpParams.is_one_jump_avail(v_from.position, v_to.position, game, level):
-                                path_to.append(GraphVertex(v_from.position, v_to.position, MovementType.JUMP_TO, game))
-                            else:
-                                path_to.append(None)
-                    else:
-                        path_to.append(None)
-                matrix.append(path_to)
-            return matrix
-
+    def __init__(self, game: model.Game, vertexes: list, workers=0, lazy=False, rows=None, csr=None):
+        """:lazy - compute the edges of a vertex the first time a search expands it,
+        :rows - edges already known for every vertex, e.g. from GraphCache,
+        :csr - (offsets, targets, move_codes, costs) of all the edges, e.g. from BackgroundEdges"""
         self.game = game
         self.vertexes = vertexes  # type: List[LevelPoint]
-        self.vertexes_map = {}
-        self.level = level
-        self.matrix = build_matrix(self.vertexes, game, level)
-        self.game = game
+        self.positions = [(int(v.position.x), int(v.position.y)) for v in vertexes]
+        grid = TileGrid.of(game.level)
+        # cell_index[y][x] - vertex a unit in cell (x, y) belongs to, see snap_index and vertex_index
+        self.cell_index = snap_index(grid, self.positions).tolist()
+
+        # Edges in CSR: the edges from vertex i are targets/move_codes/costs[offsets[i]:offsets[i + 1]],
+        # by target. In the lazy mode rows[i] holds these arrays once vertex i is expanded
+        self.offsets = self.targets = self.move_codes = self.costs = None
+        self.rows = [None] * len(vertexes)
+        self.rows_computed = 0
+        self.edges_computed = 0
+        # Search buffers, reused by every call of search
+        self.distance, self.parent, self.parent_edge, self.visited, self.closed = [], [], [], [], []
+        self.search_rows = [None] * len(vertexes)  # (targets, costs) lists of the edges from i, made once
+        self.search_id = 0
+        self.routes = None  # type: Optional[RoutingTable]
+        self.clusters = None  # type: Optional[ClusterGraph]
+        if lazy and rows is None and csr is None:
+            self.builder = EdgeBuilder(grid, game.properties, self.positions)
+            return
+        self.builder = None
+        if csr is None:
+            if rows is None:
+                rows = build_rows(grid, game.properties, self.positions, workers)
+            csr = csr_arrays([edge_arrays(game.properties, self.positions, i, row) for i, row in enumerate(rows)])
+        self.offsets, self.targets, self.move_codes, self.costs = csr
+        self.rows_computed = len(vertexes)
+        self.edges_computed = len(self.targets)
+        self.rows = [(self.targets[begin:end], self.move_codes[begin:end], self.costs[begin:end])
+                     for begin, end in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())]
+
+    def edges(self, i):
+        """(targets, move_codes, costs) arrays of the edges from vertex :i"""
+        row = self.rows[i]
+        if row is None:
+            row = self.rows[i] = edge_arrays(self.game.properties, self.positions, i, self.builder.row(i))
+            self.rows_computed += 1
+            self.edges_computed += len(row[0])
+        return row
+
+    def edge(self, i, j, move_code, cost) -> GraphVertex:
+        """GraphVertex of one edge, only built for the edges of a returned path"""
+        vert = GraphVertex(self.vertexes[i].position, self.vertexes[j].position, MovementType(move_code), self.game)
+        vert.move_time = cost
+        return vert
+
+    def edge_between(self, i, j) -> GraphVertex:
+        targets, move_codes, costs = self.edges(i)
+        k = int(np.searchsorted(targets, j))
+        return self.edge(i, j, int(move_codes[k]), float(costs[k]))
+
+    def edge_list(self):
+        """(source, target, MovementType value) of every computed edge"""
+        return [(i, j, code)
+                for i, row in enumerate(self.rows) if row is not None
+                for j, code in zip(row[0].tolist(), row[1].tolist())]
+
+    def stats(self):
+        stats = {
+            'rows_computed': self.rows_computed,
+            'edges_computed': self.edges_computed,
+            'edges_possible': len(self.vertexes) ** 2,
+        }
+        if self.builder is not None:
+            stats['jump_checks'] = self.builder.jump_checks
+        return stats
+
+    def vertex_index(self, position: model.Vec2Double) -> Optional[int]:
+        """Vertex of :position: its own cell, the landing cell below it or the nearest one.
+        None only for a graph without vertices"""
+        if not self.vertexes:
+            return None
+        y = min(max(int(position.y), 0), len(self.cell_index) - 1)
+        row = self.cell_index[y]
+        x = min(max(int(position.x), 0), len(row) - 1)
+        if row[x] < 0:
+            # Nothing to land on from this cell, the nearest vertex is found once and kept
+            row[x] = min(range(len(self.positions)),
+                         key=lambda i: (self.positions[i][0] - x) ** 2 + (self.positions[i][1] - y) ** 2)
+        return row[x]
+
+    def distance_field(self, position: model.Vec2Double) -> Optional[DistanceField]:
+        """Move times from the vertex at :position to all vertices, one search for all targets"""
+        index = self.vertex_index(position)
+        return DistanceField.from_search(self, index) if index is not None else None
+
+    def heuristic(self, i, index_to):
+        """Lower bound of the move time from vertex :i to :index_to.
+
+        An edge takes at least |dx| / max horizontal speed, and a jump rises
+        |dy + 0.3| >= 0.7 |dy| at no more than jump + fall speed (see
+        JumpParams.get_rise_time). Both bounds add up along a path, so the
+        heuristic stays admissible and consistent.
+        """
+        (x, y), (to_x, to_y) = self.positions[i], self.positions[index_to]
+        props = self.game.properties
+        return max(abs(to_x - x) / props.unit_max_horizontal_speed,
+                   0.7 * abs(to_y - y) / (props.unit_jump_speed + props.unit_fall_speed))
+
+    def search(self, index_from, index_to=None):
+        """A* from :index_from to :index_to, Dijkstra over the whole graph if it's None.
+
+        Results are in the buffers reused by every search: distance[i] and
+        parent[i] are valid where visited[i] == self.search_id
+        """
+        if len(self.distance) != len(self.vertexes):
+            self.distance = [0.] * len(self.vertexes)
+            self.parent = [-1] * len(self.vertexes)  # vertex before i
+            self.parent_edge = [0] * len(self.vertexes)  # position of the edge to i in the row of parent[i]
+            self.visited = [0] * len(self.vertexes)
+            self.closed = [0] * len(self.vertexes)
+        # Stamping the entries with the search id spares clearing the buffers
+        self.search_id += 1
+        search_id, distance, parent, parent_edge, visited, closed, search_rows = \
+            self.search_id, self.distance, self.parent, self.parent_edge, self.visited, self.closed, self.search_rows
+
+        distance[index_from] = 0.
+        parent[index_from] = -1
+        visited[index_from] = search_id
+        heap = [(0., index_from)]
+        while heap:
+            _, cur_i = heapq.heappop(heap)
+            if closed[cur_i] == search_id:
+                continue
+            if cur_i == index_to:
+                break
+            closed[cur_i] = search_id
+            cur_distance = distance[cur_i]
+            row = search_rows[cur_i]
+            if row is None:
+                targets, _, costs = self.edges(cur_i)
+                row = search_rows[cur_i] = (targets.tolist(), costs.tolist())
+            for k, (i, cost) in enumerate(zip(*row)):
+                new_distance = cur_distance + cost
+                if visited[i] != search_id or new_distance < distance[i]:
+                    visited[i] = search_id
+                    distance[i] = new_distance
+                    parent[i] = cur_i
+                    parent_edge[i] = k
+                    estimate = new_distance if index_to is None else new_distance + self.heuristic(i, index_to)
+                    heapq.heappush(heap, (estimate, i))
+
+    def movements(self, vertices: List[int]) -> List[Movement]:
+        """Movements along a path of vertex indices, the last one first as get_path returns them"""
+        return [self.edge_between(i, j).get_movement() for i, j in reversed(list(zip(vertices, vertices[1:])))]
+
+    def replanner(self, position_from: model.Vec2Double, position_to: model.Vec2Double) -> Optional[Replanner]:
+        """Incremental plan between two positions, to repair as edge costs change"""
+        if not self.vertexes:
+            return None
+        return Replanner(self, self.vertex_index(position_from), self.vertex_index(position_to))
 
     def get_path(self, position_from: model.Vec2Double, position_to: model.Vec2Double, game: model.Game) -> List[Movement]:
-        path = []
-        index_from = self.vertexes_map[(int(position_from.x), int(position_from.y))]
-        index_to = self.vertexes_map[(int(position_to.x), int(position_to.y))]
-        if not index_from or not index_to:
+        """Fastest path, its last movement first; None if there is no vertex at either end"""
+        index_from = self.vertex_index(position_from)
+        index_to = self.vertex_index(position_to)
+        if index_from is None or index_to is None:
             return None
-        reverse_path = [None, ] * len(self.vertexes)
-        queue = deque()
-        queue.append(index_from)
-        reverse_path[index_from] = (-1, None)
-        step = 1
-        while len(queue) > 0:
-            cur_i = queue.pop()
-            iteration_vertex = self.vertexes[cur_i]
-            for i, vert in enumerate(self.matrix[cur_i]):
-                if vert is not None and not reverse_path[i]:
-                    if self.vertexes_map[vert.to_position.get_tuple()] == index_to:
-                        path.append(vert)
-                        prev_pos = cur_i
-                        while prev_pos != -1:
-                            path.append(reverse_path[prev_pos][1])
-                            prev_pos = reverse_path[prev_pos][0]
-                        queue.clear()
-                        break
-                    queue.append(i)
-                    reverse_path[i] = (cur_i, vert)
-            step += 1
-        return [a.get_movement() for a in path[:-1]]
-
-    def __vertex_index_by_coord(self, vertex: model.Vec2Double):
-        v_x = round(vertex.x)
-        v_y = round(vertex.y)
-        ind = None
-        for i, v in enumerate(self.vertexes):
-            if v.position.x == v_x and v.position.y == v_y:
-                return i
+        if self.routes is not None or self.clusters is not None:
+            router = self.routes if self.routes is not None else self.clusters
+            return self.movements(router.path(index_from, index_to) or [index_from])
+        self.search(index_from, index_to)
+        if self.visited[index_to] != self.search_id:
+            return []
+        path = []
+        i = index_to
+        while i != index_from:
+            prev_i, k = self.parent[i], self.parent_edge[i]
+            _, move_codes, costs = self.edges(prev_i)
+            path.append(self.edge(prev_i, i, int(move_codes[k]), float(costs[k])).get_movement())
+            i = prev_i
+        return path
 
 
 class MyStrategy:
-    def __init__(self):
+    def __init__(self, graph_workers=0, lazy_graph=False, graph_cache=None, routes=False, cluster_size=0,
+                 background_graph=True):
         self.is_initialized = False
+        self.graph_workers = graph_workers  # processes building the graph, 0 - build in place
+        self.lazy_graph = lazy_graph  # compute graph edges only when a path search needs them
+        self.graph_cache = GraphCache(graph_cache) if graph_cache else None  # directory of built graphs
+        self.routes = routes  # answer path queries from an all-pairs RoutingTable
+        self.cluster_size = cluster_size  # search paths over a ClusterGraph of this cluster side, 0 - flat search
         self.jump_dy_max = 0
         self.jump_dx_max = 0
 
         self.graph = None
-
-        self.level_points = None
-
-        self.ground_tiles = [model.tile.Tile.WALL, model.tile.Tile.PLATFORM]
+        # Build the graph edges in other processes; fallback_action drives the unit meanwhile
+        self.background_graph = background_graph
+        self.graph_edges = None  # type: Optional[BackgroundEdges]
 
         self.movement = deque()
 
-    def make_graph(self, game: model.Game, level_points: List[List[LevelPoint]]):
-        def is_under_surface(tiles, i, j):
+    def make_graph(self, game: model.Game, built: Optional[BackgroundEdges] = None):
+        """:built - finished BackgroundEdges of :game, its edges and path tables are used as they are"""
+        grid = TileGrid.of(game.level)
+        cached = self.graph_cache.load(game) if self.graph_cache and built is None else None
+        if cached:
+            positions, rows = cached
+            vertexes = [LevelPoint(grid.tile(x, y), model.Vec2Double(x, y)) for x, y in positions]
+            g = Graph(game, vertexes, rows=rows)
+        else:
             # TODO: добавить лестницы!!!
-            if tiles[i][j] in [model.Tile.EMPTY, model.Tile.LADDER] and\
-                i > 0 and\
-                    tiles[i-1][j] in self.ground_tiles:
-                return True
-            return False
-
-        vertexes = []
-        tiles = list(zip(*game.level.tiles))
-        for i, tile_row in enumerate(tiles):
-            for j, tile in enumerate(tile_row):
-                if is_under_surface(tiles, i, j):
-                    vertexes.append(LevelPoint(tile, model.Vec2Double(j, i)))  # (i, j) -> (y, x)
-        g = Graph(game, level_points, vertexes)
+            positions = grid.standable_cells()
+            vertexes = [LevelPoint(grid.tile(x, y), model.Vec2Double(x, y)) for x, y in positions]
+            g = Graph(game, vertexes, self.graph_workers, self.lazy_graph, csr=built.arrays() if built else None)
+            if self.graph_cache and not self.lazy_graph:
+                self.__save_to_cache(self.graph_cache.save, game, positions, g.edge_list())
+
+        if self.routes:
+            g.routes = self.graph_cache.load_routes(game) if self.graph_cache and built is None else None
+            if g.routes is None:
+                g.routes = built.routes() if built else RoutingTable.build(g)
+                if self.graph_cache:
+                    self.__save_to_cache(self.graph_cache.save_routes, game, g.routes)
+        elif self.cluster_size:
+            g.clusters = ClusterGraph(g, self.cluster_size, built.cluster_costs() if built else None)
         return g
 
+    @staticmethod
+    def __save_to_cache(save, *args):
+        try:
+            save(*args)
+        except OSError as e:
+            print('graph cache: {}'.format(e))
+
     def initialize(self, unit: model.Unit, game: model.Game):
         if not self.is_initialized:
             self.jump_dy_max = game.properties.unit_jump_time * game.properties.unit_jump_speed
             self.jump_dx_max = game.properties.unit_jump_time * game.properties.unit_max_horizontal_speed
 
-            self.level_points = []
-            for i, tile_row in enumerate(list(zip(*game.level.tiles))):
-                level_row = []
-                for j, tile in enumerate(tile_row):
-                    level_row.append(LevelPoint(tile, model.Vec2Double(j, i))) # (i,j) -> (y,x)
-                self.level_points.append(level_row)
-
-            print(str(datetime.now()))
-            self.graph = self.make_graph(game, self.level_points)
             print(str(datetime.now()))
+            # A lazy or cached graph is cheap to make right away
+            if self.background_graph and not self.lazy_graph and \
+                    not (self.graph_cache and self.graph_cache.contains(game, self.routes)):
+                grid = TileGrid.of(game.level)
+                self.graph_edges = BackgroundEdges(grid, game.properties, grid.standable_cells(), self.graph_workers,
+                                                   routes=self.routes, cluster_size=self.cluster_size)
+            else:
+                self.on_graph_ready(self.make_graph(game), unit, game)
+
+            self.is_initialized = True
 
-            a = self.graph.get_path(unit.position, model.Vec2Double(25., 9.), game)
+        if self.graph is None and self.graph_edges is not None and self.graph_edges.done():
+            self.on_graph_ready(self.make_graph(game, self.graph_edges), unit, game)
+            self.graph_edges = None
 
-            self.movement.extend(a)
+    def on_graph_ready(self, graph: Graph, unit: model.Unit, game: model.Game):
+        print(str(datetime.now()))
+        self.graph = graph
 
-            self.is_initialized = True
+        a = self.graph.get_path(unit.position, model.Vec2Double(25., 9.), game)
+
+        self.movement.extend(a or [])
+
+    def fallback_action(self, unit: model.Unit, game: model.Game) -> model.UnitAction:
+        """Cheap reactive control for the ticks before the graph is built: run at the
+        nearest enemy, jump over walls in the way"""
+        enemies = [enemy for enemy in game.units if enemy.player_id != unit.player_id]
+        target = min(enemies, key=lambda enemy: distance_sqr(enemy.position, unit.position)) if enemies else None
+
+        velocity = 0
+        jump = False
+        aim = model.Vec2Double(0, 0)
+        if target is not None:
+            direction = get_sign(target.position.x - unit.position.x)
+            velocity = direction * game.properties.unit_max_horizontal_speed
+            # From the unit's side to a bit over half a cell in front of it: a box of no width, or one
+            # ending right at the face of a wall, doesn't touch the wall
+            side = unit.position.x + direction * unit.size.x / 2
+            ahead = side + direction * 0.51
+            jump = TileGrid.of(game.level).box_touches('wall', min(side, ahead), unit.position.y,
+                                                       max(side, ahead), unit.position.y + unit.size.y)
+            aim = model.Vec2Double(target.position.x - unit.position.x, target.position.y - unit.position.y)
+
+        return model.UnitAction(
+            velocity=velocity,
+            jump=jump,
+            jump_down=False,
+            aim=aim,
+            shoot=True,
+            reload=False,
+            swap_weapon=False,
+            plant_mine=False)
 
     def current_movement(self) -> Movement:
         if len(self.movement) > 0:
@@ -214,6 +350,8 @@ class MyStrategy:
         # Replace this code with your own
 
         self.initialize(unit, game)
+        if self.graph is None:
+            return self.fallback_action(unit, game)
 
         aim = model.Vec2Double(0, 0)
         move = self.current_movement()
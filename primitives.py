@@ -7,10 +7,15 @@ from model import Vec2Double, Tile
 
 
 class LevelPoint(object):
+    __slots__ = ('tile', 'position')
+
     def __init__(self, tile: Tile, position: Vec2Double):
         self.tile = tile
         self.position = position
-        self.lines = TileLines(self.position)
+
+    @property
+    def lines(self) -> 'TileLines':
+        return TileLines(self.position)
 
     def stred_position(self):
         return str(int(self.position.x)) + str(int(self.position.y))
@@ -64,6 +69,38 @@ class Line(object):
     def is_inside(self, point: Vec2Double) -> bool:
         return math.fabs(distance(self.v1, self.v2) - (distance(point, self.v1) + distance(point, self.v2))) < 0.01
 
+    def crosses_edge(self, x1, y1, x2, y2) -> bool:
+        """Whether the line meets the segment (x1;y1)-(x2;y2) inside the segment.
+
+        Same as Line((x1;y1), (x2;y2)).common_point_with(self) followed by
+        is_inside, without creating Line and Vec2Double objects.
+        """
+        a = y1 - y2
+        b = x2 - x1
+        d = a * self.B - self.A * b
+        if d == 0.:
+            return False
+        c1 = -(x1 * y2 - x2 * y1)
+        c2 = -self.C
+        x = (c1 * self.B - c2 * b) / d
+        y = (a * c2 - self.A * c1) / d
+        length = math.sqrt(math.fabs((x1 - x2) ** 2 + (y1 - y2) ** 2))
+        to_first = math.sqrt(math.fabs((x - x1) ** 2 + (y - y1) ** 2))
+        to_second = math.sqrt(math.fabs((x - x2) ** 2 + (y - y2) ** 2))
+        return math.fabs(length - (to_first + to_second)) < 0.01
+
+
+def tile_edges(x, y):
+    """Edges of the tile cell (x;y) as (x1, y1, x2, y2), in TileLines order:
+    left, bottom, top, right. Like TileLines.right, the right edge repeats the top one.
+    """
+    return (
+        (x, y, x, y + 1),
+        (x, y, x + 1, y),
+        (x, y + 1, x + 1, y + 1),
+        (x, y + 1, x + 1, y + 1),
+    )
+
 
 class TileLines(object):
     def __init__(self, position: Vec2Double):
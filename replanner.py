@@ -0,0 +1,130 @@
+"""Incremental replanning on the navigation graph.
+
+Enemies, live mines and bullets make some edges unsafe for a few ticks.
+Replanner keeps a D* Lite search from the goal back to the unit: when edge
+costs change or the unit moves, only the vertices whose distance to the
+goal is affected are expanded again instead of running a new search.
+"""
+import heapq
+from typing import Dict, Iterable, List, Optional, Tuple
+
+INF = float('inf')
+
+
+class Replanner(object):
+    def __init__(self, graph, index_from, index_to):
+        """:graph - my_strategy.Graph, plans from vertex :index_from to :index_to"""
+        self.graph = graph
+        count = len(graph.vertexes)
+        self.successors = [[] for _ in range(count)]  # (target, base cost)
+        self.predecessors = [[] for _ in range(count)]  # sources of the edges to i
+        for i in range(count):
+            targets, _, costs = graph.edges(i)
+            for j, cost in zip(targets.tolist(), costs.tolist()):
+                self.successors[i].append((j, cost))
+                self.predecessors[j].append(i)
+        self.overrides = {}  # type: Dict[Tuple[int, int], float]
+
+        self.start = self.last_start = index_from
+        self.goal = index_to
+        self.key_modifier = 0.
+        # g[i] - distance from i to the goal as last expanded, rhs[i] - its one-step lookahead
+        self.g = [INF] * count
+        self.rhs = [INF] * count
+        self.rhs[index_to] = 0.
+        self.queued = {index_to: self.key(index_to)}  # current key of every vertex in the heap
+        self.heap = [(self.queued[index_to], index_to)]
+
+        self.expanded = 0  # vertices expanded by the last repair
+        self.total_expanded = 0
+        self.repair()
+
+    def cost(self, i, j, base):
+        return self.overrides.get((i, j), base)
+
+    def key(self, i):
+        distance = min(self.g[i], self.rhs[i])
+        # Rounded so that ties of float sums along different paths compare as ties
+        return round(distance + self.graph.heuristic(self.start, i) + self.key_modifier, 9), round(distance, 9)
+
+    def update_vertex(self, i):
+        if i != self.goal:
+            g = self.g
+            self.rhs[i] = min([self.cost(i, j, base) + g[j] for j, base in self.successors[i]], default=INF)
+        if self.g[i] != self.rhs[i]:
+            key = self.key(i)
+            self.queued[i] = key
+            heapq.heappush(self.heap, (key, i))
+        else:
+            self.queued.pop(i, None)
+
+    def repair(self) -> int:
+        """Bring the distances to the goal up to date, returns the number of expanded vertices"""
+        expanded = 0
+        heap, queued, g, rhs = self.heap, self.queued, self.g, self.rhs
+        while heap:
+            key, i = heap[0]
+            if queued.get(i) != key:
+                # Entry left by a later update of the vertex
+                heapq.heappop(heap)
+                continue
+            if key >= self.key(self.start) and rhs[self.start] == g[self.start]:
+                break
+            heapq.heappop(heap)
+            new_key = self.key(i)
+            if key < new_key:
+                queued[i] = new_key
+                heapq.heappush(heap, (new_key, i))
+                continue
+            del queued[i]
+            expanded += 1
+            if g[i] > rhs[i]:
+                g[i] = rhs[i]
+                for p in self.predecessors[i]:
+                    self.update_vertex(p)
+            else:
+                g[i] = INF
+                self.update_vertex(i)
+                for p in self.predecessors[i]:
+                    self.update_vertex(p)
+        self.expanded = expanded
+        self.total_expanded += expanded
+        return expanded
+
+    def move_start(self, index):
+        """The unit got to vertex :index"""
+        self.key_modifier += self.graph.heuristic(self.last_start, index)
+        self.start = self.last_start = index
+
+    def set_costs(self, costs: Dict[Tuple[int, int], Optional[float]]) -> int:
+        """Change the cost of edges (source, target), None restores the built one.
+
+        A cost below the built one is raised to it: Graph.heuristic is a lower
+        bound of the built move times only, a cheaper edge would make it
+        overestimate and the repaired plan might not be the shortest.
+        Returns the number of vertices the repair expanded
+        """
+        for (i, j), cost in costs.items():
+            if cost is None:
+                self.overrides.pop((i, j), None)
+            else:
+                base = next((base for target, base in self.successors[i] if target == j), None)
+                if base is None:
+                    continue
+                self.overrides[(i, j)] = max(cost, base)
+            self.update_vertex(i)
+        return self.repair()
+
+    def edges_into(self, vertices: Iterable[int], cost=INF) -> Dict[Tuple[int, int], float]:
+        """Changes giving :cost to every edge that ends at :vertices, e.g. the ones an enemy stands at"""
+        return {(p, i): cost for i in vertices for p in self.predecessors[i]}
+
+    def path(self) -> Optional[List[int]]:
+        """Vertices of the current plan from the start to the goal, None if the goal is unreachable"""
+        if self.g[self.start] == INF and self.rhs[self.start] == INF:
+            return None
+        path = [self.start]
+        while path[-1] != self.goal and len(path) <= len(self.g):
+            i = path[-1]
+            path.append(min(self.successors[i], key=lambda edge: self.cost(i, edge[0], edge[1]) + self.g[edge[0]])[0])
+        return path if path[-1] == self.goal else None
@@ -0,0 +1,57 @@
+"""All-pairs routing over the navigation graph.
+
+The graph doesn't change during a game and path queries always go between
+its vertices, so a Dijkstra from every vertex can be run once. Its result
+is kept as two V x V matrices:
+    next_hop[a][b] - the vertex after a on the fastest path to b (uint16,
+                     UNREACHABLE where there is no path);
+    distance[a][b] - the move time of that path (float32, inf if none).
+A path query is then a walk over next_hop, no search at all.
+"""
+from typing import List, Optional
+
+import numpy as np
+
+UNREACHABLE = 0xFFFF
+
+
+class RoutingTable(object):
+    def __init__(self, next_hop: np.ndarray, distance: np.ndarray):
+        self.next_hop = next_hop
+        self.distance = distance
+
+    @staticmethod
+    def build(graph) -> 'RoutingTable':
+        """Run Graph.search from every vertex of :graph"""
+        count = len(graph.vertexes)
+        if count >= UNREACHABLE:
+            raise ValueError('{} vertices do not fit the uint16 next hop table'.format(count))
+        next_hop = np.full((count, count), UNREACHABLE, dtype=np.uint16)
+        distance = np.full((count, count), np.inf, dtype=np.float32)
+        for source in range(count):
+            graph.search(source)
+            reached = [i for i in range(count) if graph.visited[i] == graph.search_id]
+            # Parents are closer than their children, so their next hops are known first
+            reached.sort(key=graph.distance.__getitem__)
+            hops = next_hop[source]
+            row = [UNREACHABLE] * count
+            for i in reached:
+                parent = graph.parent[i]
+                if parent == source:
+                    row[i] = i
+                elif parent != -1:
+                    row[i] = row[parent]
+            hops[:] = row
+            distance[source, reached] = [graph.distance[i] for i in reached]
+            hops[source] = source
+        return RoutingTable(next_hop, distance)
+
+    def path(self, index_from, index_to) -> Optional[List[int]]:
+        """Vertices of the fastest path from :index_from to :index_to, None if there is none"""
+        if self.next_hop[index_from, index_to] == UNREACHABLE:
+            return None
+        path = [index_from]
+        next_hop = self.next_hop
+        while path[-1] != index_to:
+            path.append(int(next_hop[path[-1], index_to]))
+        return path
@@ -34,12 +34,19 @@ class StreamWrapper:
     def read_double(self):
         return self.DOUBLE_FORMAT_STRUCT.unpack(self.stream.read(8))[0]
 
-    def read_string(self):
-        length = self.read_int()
+    def read_bytes(self, length):
         data = self.stream.read(length)
         if len(data) != length:
             raise IOError("Unexpected EOF")
-        return data.decode("utf-8")
+        return data
+
+    def read_string(self):
+        length = self.read_int()
+        return self.read_bytes(length).decode("utf-8")
+
+    def read_struct(self, fmt):
+        """Read several packed fields at once with a precompiled struct.Struct"""
+        return fmt.unpack(self.read_bytes(fmt.size))
 
     # Writing primitives
 
@@ -62,3 +69,86 @@ class StreamWrapper:
         data = value.encode("utf-8")
         self.write_int(len(data))
         self.stream.write(data)
+
+    def write_struct(self, fmt, *values):
+        self.stream.write(fmt.pack(*values))
+
+
+class BufferedStreamWrapper(StreamWrapper):
+    """Reader that pulls the stream in chunks into one reusable buffer.
+
+    Primitives are decoded in place with ``struct.unpack_from``, so a whole
+    ServerMessageGame costs a few socket reads instead of one read (and one
+    bytes object) per field. Writing goes straight to the stream as before.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        super().__init__(stream)
+        self.buffer = bytearray(chunk_size)
+        self.position = 0
+        self.end = 0
+
+    def _fill(self, size):
+        """Make at least :size unread bytes available in the buffer"""
+        available = self.end - self.position
+        if self.position:
+            self.buffer[:available] = self.buffer[self.position:self.end]
+            self.position = 0
+            self.end = available
+        if len(self.buffer) < size:
+            self.buffer.extend(bytes(max(size, 2 * len(self.buffer)) - len(self.buffer)))
+        view = memoryview(self.buffer)
+        try:
+            while self.end < size:
+                # readinto1 returns whatever is ready instead of waiting for the whole chunk
+                count = self.stream.readinto1(view[self.end:])
+                if not count:
+                    raise IOError("Unexpected EOF")
+                self.end += count
+        finally:
+            view.release()
+
+    def read_struct(self, fmt):
+        if self.end - self.position < fmt.size:
+            self._fill(fmt.size)
+        value = fmt.unpack_from(self.buffer, self.position)
+        self.position += fmt.size
+        return value
+
+    # Reading primitives
+
+    def read_bool(self):
+        return self.read_struct(self.BOOL_FORMAT_STRUCT)[0]
+
+    def read_int(self):
+        return self.read_struct(self.INT_FORMAT_STRUCT)[0]
+
+    def read_long(self):
+        return self.read_struct(self.LONG_FORMAT_STRUCT)[0]
+
+    def read_float(self):
+        return self.read_struct(self.FLOAT_FORMAT_STRUCT)[0]
+
+    def read_double(self):
+        return self.read_struct(self.DOUBLE_FORMAT_STRUCT)[0]
+
+    def read_bytes(self, length):
+        if self.end - self.position < length:
+            self._fill(length)
+        data = bytes(self.buffer[self.position:self.position + length])
+        self.position += length
+        return data
+
+
+class BytesStreamWrapper(BufferedStreamWrapper):
+    """Reader over bytes that are already in memory, e.g. one entity of a message"""
+
+    def __init__(self, data, position=0):
+        super().__init__(None, 0)
+        self.buffer = data
+        self.position = position
+        self.end = len(data)
+
+    def _fill(self, size):
+        raise IOError("Unexpected EOF")
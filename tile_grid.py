@@ -0,0 +1,91 @@
+"""Shared NumPy view of a level's tiles.
+
+level.tiles is indexed [x][y]; every consumer used to transpose it with
+list(zip(*tiles)) and scan the rows with `in` checks. TileGrid does it once
+per Level: a (y, x) uint8 array plus boolean masks of every terrain class.
+
+The masks queried by rectangle also get a summed-area table, so "is there
+any wall (jump pad, empty, ...) tile in this rectangle" is four lookups
+whatever its size.
+"""
+import math
+import weakref
+
+import numpy as np
+
+import model
+
+
+class TileGrid(object):
+    def __init__(self, level: model.Level):
+        # (y, x) rows of Tile members for code that works with the enum
+        self.rows = list(zip(*level.tiles))
+        self.tiles = np.array(self.rows, dtype=np.uint8).reshape(len(self.rows), -1)
+        self.height, self.width = self.tiles.shape
+
+        self.empty = self.tiles == model.Tile.EMPTY
+        self.wall = self.tiles == model.Tile.WALL
+        self.platform = self.tiles == model.Tile.PLATFORM
+        self.ladder = self.tiles == model.Tile.LADDER
+        self.jump_pad = self.tiles == model.Tile.JUMP_PAD
+
+        # Tiles a jump can't pass through
+        self.solid = self.wall | self.platform | self.jump_pad
+        self.solid_rows = self.solid.tolist()
+        # Tiles a unit can stand on
+        self.ground = self.wall | self.platform
+
+        # Free cell right above the ground: the places a unit can stand at
+        self.standable = np.zeros_like(self.empty)
+        self.standable[1:] = (self.empty[1:] | self.ladder[1:]) & self.ground[:-1]
+
+        # sums[name][y][x] is the number of :name tiles below y and left of x.
+        # Kept as lists too: scalar lookups on them are much cheaper than on arrays
+        self.sum_tables = {}
+        self.sums = {}
+        for name in ('empty', 'wall', 'jump_pad', 'solid'):
+            table = np.zeros((self.height + 1, self.width + 1), dtype=np.int32)
+            table[1:, 1:] = getattr(self, name).cumsum(axis=0).cumsum(axis=1)
+            self.sum_tables[name] = table
+            self.sums[name] = table.tolist()
+
+    def tile(self, x, y) -> model.Tile:
+        return self.rows[y][x]
+
+    def count(self, name, x_from, y_from, x_to, y_to):
+        """Number of :name tiles in columns [x_from, x_to) and rows [y_from, y_to)"""
+        x_from = min(max(x_from, 0), self.width)
+        x_to = min(max(x_to, x_from), self.width)
+        y_from = min(max(y_from, 0), self.height)
+        y_to = min(max(y_to, y_from), self.height)
+        sums = self.sums[name]
+        return sums[y_to][x_to] - sums[y_from][x_to] - sums[y_to][x_from] + sums[y_from][x_from]
+
+    def row_counts(self, name, y_from, y_to) -> np.ndarray:
+        """counts[x] - number of :name tiles in rows [y_from, y_to) left of x, for x up to width"""
+        y_from = min(max(y_from, 0), self.height)
+        y_to = min(max(y_to, y_from), self.height)
+        table = self.sum_tables[name]
+        return table[y_to] - table[y_from]
+
+    def any_in(self, name, x_from, y_from, x_to, y_to):
+        return self.count(name, x_from, y_from, x_to, y_to) > 0
+
+    def box_touches(self, name, left, bottom, right, top):
+        """Whether an axis-aligned box in level coordinates overlaps any :name tile"""
+        return self.any_in(name, math.floor(left), math.floor(bottom), math.ceil(right), math.ceil(top))
+
+    def standable_cells(self):
+        """(x, y) of every standable cell, row by row from the bottom"""
+        return [(int(x), int(y)) for y, x in np.argwhere(self.standable)]
+
+    _grids = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def of(level: model.Level) -> 'TileGrid':
+        """Grid of :level, built once per Level object"""
+        grid = TileGrid._grids.get(level)
+        if grid is None:
+            grid = TileGrid(level)
+            TileGrid._grids[level] = grid
+        return grid
@@ -0,0 +1,236 @@
+"""Tick-accurate unit motion, many trajectories at once.
+
+JumpParams approximates a jump with two straight lines. UnitSimulator
+steps the server's motion model instead, updates_per_tick micro-steps per
+tick, for N units kept as NumPy arrays (UnitStates), so edge checks and
+action search can run thousands of rollouts per tick:
+    * horizontal speed is clamped to unit_max_horizontal_speed, walls stop
+      the unit box;
+    * a jump rises at the jump state speed while jump is held (or can't be
+      cancelled) and time is left, then the unit falls at unit_fall_speed;
+      hitting a wall with the head ends the jump;
+    * walls always, platforms and ladder tops unless jump_down is held, stop
+      a fall; standing on them restores the full jump;
+    * a unit whose center is on a ladder climbs with jump, goes down with
+      jump_down and otherwise holds on;
+    * touching a jump pad starts an uncancellable jump_pad_jump_speed jump.
+Units don't collide with each other here.
+
+    python unit_simulator.py
+
+checks that a full jump rises unit_jump_speed * unit_jump_time, as
+JumpParams.get_jump_max_dy assumes.
+"""
+import math
+import sys
+from typing import List
+
+import numpy as np
+
+import model
+from movements import JumpParams
+from tile_grid import TileGrid
+
+# Distance the box sides are pulled in by, so that a unit touching a tile isn't inside it
+EPSILON = 1e-9
+
+# Tile kinds as bits, one lookup answers all the questions about a cell
+WALL, PLATFORM, LADDER, JUMP_PAD = 1, 2, 4, 8
+TILE_FLAGS = np.zeros(max(model.Tile) + 1, dtype=np.uint8)
+TILE_FLAGS[model.Tile.WALL] = WALL
+TILE_FLAGS[model.Tile.PLATFORM] = PLATFORM
+TILE_FLAGS[model.Tile.LADDER] = LADDER
+TILE_FLAGS[model.Tile.JUMP_PAD] = JUMP_PAD
+
+
+class UnitStates(object):
+    """Position (bottom center) and jump state of N simulated units"""
+
+    def __init__(self, x, y, can_jump, jump_speed, jump_time, can_cancel):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.can_jump = np.asarray(can_jump, dtype=bool)
+        self.jump_speed = np.asarray(jump_speed, dtype=np.float64)
+        self.jump_time = np.asarray(jump_time, dtype=np.float64)
+        self.can_cancel = np.asarray(can_cancel, dtype=bool)
+
+    def __len__(self):
+        return len(self.x)
+
+    def copy(self) -> 'UnitStates':
+        return UnitStates(self.x.copy(), self.y.copy(), self.can_jump.copy(), self.jump_speed.copy(),
+                          self.jump_time.copy(), self.can_cancel.copy())
+
+    def positions(self) -> np.ndarray:
+        return np.stack([self.x, self.y], axis=1)
+
+    @staticmethod
+    def from_units(units: List[model.Unit], repeat=1) -> 'UnitStates':
+        """States of :units, each one :repeat times in a row (e.g. one per candidate action)"""
+        def column(values):
+            return np.repeat(np.array(values), repeat)
+
+        return UnitStates(
+            column([unit.position.x for unit in units]),
+            column([unit.position.y for unit in units]),
+            column([unit.jump_state.can_jump for unit in units]),
+            column([unit.jump_state.speed for unit in units]),
+            column([unit.jump_state.max_time for unit in units]),
+            column([unit.jump_state.can_cancel for unit in units]),
+        )
+
+
+class UnitSimulator(object):
+    def __init__(self, level: model.Level, properties: model.Properties, updates_per_tick=None):
+        """:updates_per_tick - micro-steps per tick, properties.updates_per_tick by default"""
+        grid = TileGrid.of(level)
+        # One extra row and column of walls around the level, out of level tiles are walls
+        self.tiles = np.full((grid.height + 2, grid.width + 2), model.Tile.WALL, dtype=np.uint8)
+        self.tiles[1:-1, 1:-1] = grid.tiles
+        self.stride = grid.width + 2
+        self.flags = TILE_FLAGS[self.tiles].ravel()
+        self.has_ladders = bool(grid.ladder.any())
+        self.has_jump_pads = bool(grid.jump_pad.any())
+        self.height, self.width = grid.height, grid.width
+        self.properties = properties
+        self.updates_per_tick = updates_per_tick or properties.updates_per_tick
+        self.dt = 1. / (properties.ticks_per_second * self.updates_per_tick)
+        self.half_width = properties.unit_size.x / 2
+        self.unit_height = properties.unit_size.y
+
+    # Cells are looked up in the bordered tiles as flat indices row * stride + column,
+    # coordinates are shifted by the border first so truncation is floor
+    def _columns(self, xs):
+        return np.clip(xs + 1, 0, self.width + 1).astype(np.intp)
+
+    def _rows(self, ys):
+        return np.clip(ys + 1, 0, self.height + 1).astype(np.intp) * self.stride
+
+    def _update(self, states: UnitStates, velocity, side_offset, jump, jump_down, supports):
+        props = self.properties
+        dt = self.dt
+        flags = self.flags
+        x, y = states.x, states.y
+        height = self.unit_height
+
+        # Horizontal move, the leading side of the box stops at a wall
+        new_x = x + velocity * dt
+        side = new_x + side_offset
+        column = self._columns(side)
+        rows = [self._rows(y + EPSILON), self._rows(y + height / 2), self._rows(y + height - EPSILON)]
+        blocked = ((flags[rows[0] + column] | flags[rows[1] + column] | flags[rows[2] + column]) & WALL) != 0
+        blocked &= velocity != 0
+        if blocked.any():
+            new_x[blocked] = np.where(velocity[blocked] > 0, np.floor(side[blocked]) - self.half_width,
+                                      np.floor(side[blocked]) + 1 + self.half_width)
+        x[:] = new_x
+        left, right = self._columns(x - self.half_width + EPSILON), self._columns(x + self.half_width - EPSILON)
+
+        # Vertical speed from the ladder or jump state
+        if self.has_ladders:
+            center = self._columns(x)
+            on_ladder = ((flags[rows[0] + center] | flags[rows[1] + center]) & LADDER) != 0
+            jumping = ~on_ladder & states.can_jump & (states.jump_time > 0) & (jump | ~states.can_cancel)
+            ladder_speed = np.where(jump, props.unit_jump_speed, np.where(jump_down, -props.unit_fall_speed, 0.))
+            vy = np.where(on_ladder, ladder_speed, np.where(jumping, states.jump_speed, -props.unit_fall_speed))
+            # A released or finished jump can't go on
+            ended = ~on_ladder & ~jumping
+        else:
+            on_ladder = False
+            jumping = states.can_jump & (states.jump_time > 0) & (jump | ~states.can_cancel)
+            vy = np.where(jumping, states.jump_speed, -props.unit_fall_speed)
+            ended = ~jumping
+        states.jump_time -= jumping * dt
+        states.can_jump &= ~ended
+        states.jump_time[ended] = 0.
+
+        new_y = y + vy * dt
+
+        # Head hits a wall: stop under it and end the jump
+        top = new_y + height
+        head_row = self._rows(top)
+        head = (vy > 0) & (((flags[head_row + left] | flags[head_row + right]) & WALL) != 0)
+        if head.any():
+            new_y[head] = np.floor(top[head]) - height
+            states.can_jump &= ~head
+            states.jump_time[head] = 0.
+
+        # Feet cross the top of a tile row: land on walls, and on platforms and ladders unless jump_down
+        boundary = np.floor(y + EPSILON)
+        below = self._rows(boundary - 1)
+        landed = (vy < 0) & (new_y < boundary) & (((flags[below + left] | flags[below + right]) & supports) != 0)
+        y[:] = np.where(landed, boundary, new_y)
+
+        # Standing or on a ladder restores the jump, a jump pad replaces it
+        standing_row = np.round(y)
+        below = self._rows(standing_row - 1)
+        standing = (np.abs(y - standing_row) < EPSILON) & (((flags[below + left] | flags[below + right]) & supports) != 0)
+        rested = (standing | on_ladder) & ~jumping
+        states.can_jump |= rested
+        states.jump_speed[rested] = props.unit_jump_speed
+        states.jump_time[rested] = props.unit_jump_time
+        states.can_cancel |= rested
+        if self.has_jump_pads:
+            touched = 0
+            for row in (self._rows(y + EPSILON), self._rows(y + height / 2), self._rows(y + height - EPSILON)):
+                touched = touched | flags[row + left] | flags[row + right]
+            on_pad = (touched & JUMP_PAD) != 0
+            states.can_jump |= on_pad
+            states.jump_speed[on_pad] = props.jump_pad_jump_speed
+            states.jump_time[on_pad] = props.jump_pad_jump_time
+            states.can_cancel &= ~on_pad
+
+    def step(self, states: UnitStates, velocity, jump, jump_down=False, ticks=1) -> UnitStates:
+        """Advance :states in place by :ticks ticks of the same actions, arrays or scalars per unit"""
+        count = len(states)
+        velocity = np.clip(np.broadcast_to(np.asarray(velocity, dtype=np.float64), (count,)),
+                           -self.properties.unit_max_horizontal_speed, self.properties.unit_max_horizontal_speed)
+        jump = np.broadcast_to(np.asarray(jump, dtype=bool), (count,))
+        jump_down = np.broadcast_to(np.asarray(jump_down, dtype=bool), (count,))
+        side_offset = np.where(velocity > 0, self.half_width, -self.half_width)
+        supports = np.where(jump_down, WALL, WALL | PLATFORM | LADDER).astype(np.uint8)
+        for _ in range(ticks * self.updates_per_tick):
+            self._update(states, velocity, side_offset, jump, jump_down, supports)
+        return states
+
+    def rollout(self, states: UnitStates, velocity, jump, jump_down=False) -> np.ndarray:
+        """Positions after every tick for per tick actions of shape (ticks, N) or (ticks,).
+
+        Returns a (ticks, N, 2) array, :states end at the last tick
+        """
+        velocity = np.asarray(velocity, dtype=np.float64)
+        jump = np.broadcast_to(np.asarray(jump, dtype=bool), velocity.shape)
+        jump_down = np.broadcast_to(np.asarray(jump_down, dtype=bool), velocity.shape)
+        positions = np.empty((len(velocity), len(states), 2))
+        for tick in range(len(velocity)):
+            self.step(states, velocity[tick], jump[tick], jump_down[tick])
+            positions[tick, :, 0] = states.x
+            positions[tick, :, 1] = states.y
+        return positions
+
+
+def check_jump_height(properties: model.Properties):
+    """(rise, seconds to the top) of a unit holding jump from the floor of an empty level"""
+    height = math.ceil(JumpParams.get_jump_max_dy(properties) + properties.unit_size.y) + 3
+    # Three free columns between walls, with a floor and a ceiling
+    column = [model.Tile.WALL] + [model.Tile.EMPTY] * (height - 2) + [model.Tile.WALL]
+    level = model.Level([[model.Tile.WALL] * height] + [list(column) for _ in range(3)] + [[model.Tile.WALL] * height])
+    simulator = UnitSimulator(level, properties)
+    states = UnitStates([2.5], [1.], [True], [properties.unit_jump_speed], [properties.unit_jump_time], [True])
+    ticks = math.ceil(properties.unit_jump_time * properties.ticks_per_second) + 2
+    ys = simulator.rollout(states, np.zeros(ticks), True)[:, 0, 1]
+    top = int(np.argmax(ys))
+    return float(ys[top] - 1.), (top + 1) / properties.ticks_per_second
+
+
+if __name__ == '__main__':
+    from bench import make_properties
+
+    properties = make_properties()
+    rise, rise_time = check_jump_height(properties)
+    expected = JumpParams.get_jump_max_dy(properties)
+    print('jump rise {:.6f} in {:.4f}s, expected {:.6f} in {:.4f}s'.format(
+        rise, rise_time, expected, properties.unit_jump_time))
+    # One micro-step of slack for the float jump time running out
+    if abs(rise - expected) > properties.unit_jump_speed / (properties.ticks_per_second * properties.updates_per_tick):
+        sys.exit(1)
@@ -0,0 +1,143 @@
+"""Columnar NumPy snapshot of the entities of one tick.
+
+WorldArrays keeps positions, velocities, sizes, health and player ids of
+units, bullets, mines and loot boxes as contiguous arrays, so targeting and
+dodging code can work on all entities at once instead of looping over
+game.units / game.bullets.
+
+For a Game decoded with GameDecoder(lazy_entities=True) the arrays are
+gathered straight from the raw entity bytes, no model objects are built.
+Units carry no velocity on the wire, it is estimated from the previous
+snapshot by unit id.
+"""
+import numpy as np
+
+import model
+from game_decoder import EntityView
+from model_codecs import field_offset
+
+
+class EntityArrays(object):
+    """Arrays of one entity kind, every array has len(self) rows"""
+
+    def __init__(self, **columns):
+        self.columns = columns
+        for name, column in columns.items():
+            setattr(self, name, column)
+
+    def __len__(self):
+        return len(self.position)
+
+    def __repr__(self):
+        return 'EntityArrays({})'.format(', '.join(sorted(self.columns)))
+
+
+# name -> (field, dtype, values per entity) read at the field's fixed offset
+LAYOUTS = {
+    model.Unit: {
+        'player_id': ('player_id', '<i4', 1),
+        'id': ('id', '<i4', 1),
+        'health': ('health', '<i4', 1),
+        'position': ('position', '<f8', 2),
+        'size': ('size', '<f8', 2),
+    },
+    model.Bullet: {
+        'unit_id': ('unit_id', '<i4', 1),
+        'player_id': ('player_id', '<i4', 1),
+        'position': ('position', '<f8', 2),
+        'velocity': ('velocity', '<f8', 2),
+        'damage': ('damage', '<i4', 1),
+        'size': ('size', '<f8', 1),
+    },
+    model.Mine: {
+        'player_id': ('player_id', '<i4', 1),
+        'position': ('position', '<f8', 2),
+        'size': ('size', '<f8', 2),
+        'state': ('state', '<i4', 1),
+    },
+    model.LootBox: {
+        'position': ('position', '<f8', 2),
+        'size': ('size', '<f8', 2),
+        # Item variant starts with its tag: 0 health pack, 1 weapon, 2 mine
+        'item': ('item', '<i4', 1),
+    },
+}
+
+
+def _record_dtype(cls):
+    """Structured dtype over the fixed-size head of a raw :cls entity"""
+    names, formats, offsets = [], [], []
+    for name, (field, dtype, count) in LAYOUTS[cls].items():
+        names.append(name)
+        formats.append((dtype, (count,)) if count > 1 else dtype)
+        offsets.append(field_offset(cls, field))
+    itemsize = max(offset + np.dtype(fmt).itemsize for offset, fmt in zip(offsets, formats))
+    return np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': itemsize})
+
+
+RECORD_DTYPES = {cls: _record_dtype(cls) for cls in LAYOUTS}
+
+
+def _from_raw(cls, raw_entities):
+    record = RECORD_DTYPES[cls]
+    lengths = np.fromiter(map(len, raw_entities), dtype=np.int64, count=len(raw_entities))
+    starts = np.zeros(len(raw_entities), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    buffer = np.frombuffer(b''.join(raw_entities), dtype=np.uint8)
+    # One gather copies the fixed-size heads of all entities next to each other
+    heads = buffer[starts[:, None] + np.arange(record.itemsize)].view(record).reshape(len(raw_entities))
+    return {name: np.ascontiguousarray(heads[name]) for name in record.names}
+
+
+def _value(entity, field):
+    value = getattr(entity, field)
+    if isinstance(value, model.Vec2Double):
+        return value.x, value.y
+    if isinstance(value, model.Item):
+        return value.TAG
+    return value
+
+
+def _from_objects(cls, entities):
+    columns = {}
+    for name, (field, dtype, count) in LAYOUTS[cls].items():
+        column = np.array([_value(entity, field) for entity in entities], dtype=dtype)
+        columns[name] = column.reshape(len(entities), count) if count > 1 else column
+    return columns
+
+
+def entity_arrays(cls, entities) -> EntityArrays:
+    if isinstance(entities, EntityView):
+        return EntityArrays(**_from_raw(cls, entities.raw_entities))
+    return EntityArrays(**_from_objects(cls, entities))
+
+
+class WorldArrays(object):
+    def __init__(self, current_tick, units, bullets, mines, loot_boxes):
+        self.current_tick = current_tick
+        self.units = units
+        self.bullets = bullets
+        self.mines = mines
+        self.loot_boxes = loot_boxes
+
+    @staticmethod
+    def from_game(game: model.Game, previous: 'WorldArrays' = None) -> 'WorldArrays':
+        units = entity_arrays(model.Unit, game.units)
+        units.velocity = np.zeros_like(units.position)
+        units.columns['velocity'] = units.velocity
+        if previous is not None and len(previous.units) and len(units):
+            # Match units by id, velocity is the per-second displacement since the previous snapshot
+            order = np.argsort(previous.units.id)
+            found = np.searchsorted(previous.units.id, units.id, sorter=order)
+            found = order[np.minimum(found, len(order) - 1)]
+            known = previous.units.id[found] == units.id
+            ticks = max(game.current_tick - previous.current_tick, 1)
+            units.velocity[known] = (units.position[known] - previous.units.position[found[known]]) * \
+                (game.properties.ticks_per_second / ticks)
+        return WorldArrays(
+            game.current_tick,
+            units,
+            entity_arrays(model.Bullet, game.bullets),
+            entity_arrays(model.Mine, game.mines),
+            entity_arrays(model.LootBox, game.loot_boxes),
+        )